@@ -0,0 +1,101 @@
+import argparse
+import difflib
+import os
+import time
+
+import torch
+
+from retrieval import read_prompts
+
+BACKENDS = ("torch", "int8", "onnx")
+
+ONNX_INSTALL_HINT = "the onnx backend needs optimum with onnxruntime: pip install optimum[onnxruntime]"
+
+
+# Dynamically quantize every Linear layer to INT8 (CPU only)
+def quantize_int8(model):
+    model = model.to("cpu")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+# The ONNX export lives next to the PyTorch weights
+def onnx_dir(path):
+    return os.path.join(path, "onnx")
+
+
+# Exported encoder, decoder and decoder-with-past graphs; generate() reuses the KV cache
+def load_onnx(path):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise ImportError(ONNX_INSTALL_HINT)
+    directory = onnx_dir(path)
+    if not os.path.isdir(directory):
+        raise FileNotFoundError(f"No ONNX export at {directory}, run: python backends.py export")
+    return ORTModelForSeq2SeqLM.from_pretrained(directory, use_cache=True, provider="CPUExecutionProvider")
+
+
+def export_onnx(path, output=None):
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError:
+        raise ImportError(ONNX_INSTALL_HINT)
+    from transformers import T5Tokenizer
+
+    output = output or onnx_dir(path)
+    model = ORTModelForSeq2SeqLM.from_pretrained(path, export=True, use_cache=True)
+    model.save_pretrained(output)
+    T5Tokenizer.from_pretrained(path).save_pretrained(output)
+    return output
+
+
+# Compare a backend's outputs against the fp32 PyTorch model on the bundled prompts
+def check_accuracy(backend, path, limit=200, max_length=150):
+    import recipe_model
+
+    recipe_model.configure_cache(0)  # every prompt must really be generated
+    prompts = read_prompts(limit=limit)
+    results = {}
+    for name in ("torch", backend):
+        model, tokenizer = recipe_model.load_model(path, backend=name)
+        start = time.perf_counter()
+        recipes = recipe_model.generate_recipes(prompts, model, tokenizer, max_length)
+        results[name] = (recipes, time.perf_counter() - start)
+
+    reference, reference_time = results["torch"]
+    candidate, candidate_time = results[backend]
+    exact = sum(a == b for a, b in zip(reference, candidate))
+    similarity = sum(difflib.SequenceMatcher(None, a, b).ratio() for a, b in zip(reference, candidate))
+
+    print(f"prompts:          {len(prompts)}")
+    print(f"exact match:      {exact / len(prompts):.1%}")
+    print(f"mean similarity:  {similarity / len(prompts):.3f}")
+    print(f"torch fp32:       {len(prompts) / reference_time:.1f} prompts/s")
+    print(f"{backend + ':':<17} {len(prompts) / candidate_time:.1f} prompts/s "
+          f"({reference_time / candidate_time:.2f}x)")
+
+
+def main():
+    import recipe_model
+
+    parser = argparse.ArgumentParser(description="Export and check alternative inference backends")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export = commands.add_parser("export", help="export the checkpoint to ONNX")
+    export.add_argument("--model-path", default=recipe_model.MODEL_PATH)
+    export.add_argument("--output", default=None)
+
+    check = commands.add_parser("check", help="compare a backend against fp32 on the bundled prompts")
+    check.add_argument("--backend", choices=BACKENDS[1:], required=True)
+    check.add_argument("--model-path", default=recipe_model.MODEL_PATH)
+    check.add_argument("--limit", type=int, default=200)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        print(f"ONNX model written to {export_onnx(args.model_path, args.output)}")
+    else:
+        check_accuracy(args.backend, args.model_path, args.limit)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+import threading
+import queue
+import time
+from concurrent.futures import Future
+
+import torch
+
+import encoder_cache
+import speculative
+import tracing
+from candidates import candidate_kwargs
+from decoding import generation_kwargs
+
+# Defaults for the micro-batching window
+MAX_BATCH_SIZE = 16
+MAX_WAIT = 0.01  # seconds to wait for more prompts before running a batch
+MAX_INPUT_LENGTH = 128
+
+
+class _Request:
+    __slots__ = ("prompt", "key", "future", "enqueued", "trace")
+
+    def __init__(self, prompt, key, trace=None):
+        self.prompt = prompt
+        self.key = key
+        self.future = Future()
+        self.enqueued = time.perf_counter()
+        self.trace = trace
+
+
+# Collects prompts arriving within a short window and runs them through
+# a single padded model.generate call, fanning the outputs back to futures.
+class BatchingEngine:
+    def __init__(self, model, tokenizer, device, max_batch_size=MAX_BATCH_SIZE, max_wait=MAX_WAIT):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+
+        self._queue = queue.Queue()
+        self._pending = []  # requests pulled off the queue that didn't fit the last batch
+        self._model_lock = threading.Lock()
+        self._worker = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._start_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="batching-engine", daemon=True)
+                self._worker.start()
+
+    # Queue a (cleaned) prompt and return a Future for the decoded recipe
+    def submit(self, prompt, max_length=150, decoding="greedy", trace=None):
+        request = _Request(prompt, (max_length, decoding), trace)
+        self._ensure_worker()
+        self._queue.put(request)
+        return request.future
+
+    # Generate a list of (cleaned) prompts in full batches, preserving order.
+    # Prompts are sorted by length so each batch pads as little as possible.
+    def generate_many(self, prompts, max_length=150, decoding="greedy", trace=None):
+        prompts = list(prompts)
+        results = [None] * len(prompts)
+        order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+        for start in range(0, len(order), self.max_batch_size):
+            chunk = order[start:start + self.max_batch_size]
+            outputs = self._generate_batch([prompts[i] for i in chunk], max_length, decoding,
+                                           [trace] * len(chunk) if trace is not None else None)
+            for i, output in zip(chunk, outputs):
+                results[i] = output
+        return results
+
+    # n candidate recipes for one (cleaned) prompt from a single generate call;
+    # the prompt is encoded once and the encoder output shared by all of them
+    def generate_candidates(self, prompt, n, max_length=150, method="sample"):
+        inputs = self.tokenizer([prompt], return_tensors="pt", truncation=True, max_length=MAX_INPUT_LENGTH)
+        input_ids = inputs['input_ids'].to(self.device)
+        attention_mask = inputs['attention_mask'].to(self.device)
+        extra = candidate_kwargs(method, n)
+        with self._model_lock, torch.inference_mode():
+            if encoder_cache.supported(self.model):
+                # Encoded once (or taken from the cache) and expanded to the n candidates by generate
+                extra["encoder_outputs"] = encoder_cache.encode(self.model, input_ids, attention_mask)
+            output = self.model.generate(input_ids, attention_mask=attention_mask, max_length=max_length, **extra)
+        return self.tokenizer.batch_decode(output, skip_special_tokens=True)
+
+    # `traces` (one per prompt, or None) collect stage timings and token counts
+    def _generate_batch(self, prompts, max_length, decoding="greedy", traces=None):
+        if decoding == "speculative" and speculative.supported(self.model):
+            # Drafts are verified one sequence at a time
+            with self._model_lock, tracing.batch_stage(traces, "decoder"):
+                return [speculative.generate(self.model, self.tokenizer, p, max_length) for p in prompts]
+
+        with tracing.batch_stage(traces, "tokenize"):
+            inputs = self.tokenizer(prompts, return_tensors="pt", padding=True, truncation=True,
+                                    max_length=MAX_INPUT_LENGTH)
+        with tracing.batch_stage(traces, "transfer"):
+            input_ids = inputs['input_ids'].to(self.device)
+            attention_mask = inputs['attention_mask'].to(self.device)
+        extra = generation_kwargs(decoding, self.tokenizer, prompts, max_length)
+
+        with self._model_lock, torch.inference_mode(), tracing.profile(traces):
+            if encoder_cache.supported(self.model) and (encoder_cache.active is not None or traces):
+                # Run the encoder separately, skipping cached prompts, so its time is reported on its own
+                with tracing.batch_stage(traces, "encoder"):
+                    extra["encoder_outputs"] = encoder_cache.encode(self.model, input_ids, attention_mask)
+                    if traces and self.device.type == "cuda":
+                        torch.cuda.synchronize()
+            with tracing.batch_stage(traces, "decoder"):
+                output = self.model.generate(input_ids, attention_mask=attention_mask,
+                                             max_length=max_length, num_return_sequences=1, **extra)
+        with tracing.batch_stage(traces, "decode"):
+            recipes = self.tokenizer.batch_decode(output, skip_special_tokens=True)
+
+        if traces:
+            pad = self.tokenizer.pad_token_id
+            counts = zip(attention_mask.sum(dim=1).tolist(), (output != pad).sum(dim=1).tolist())
+            for trace, (prompt_tokens, recipe_tokens) in zip(traces, counts):
+                if trace is not None:
+                    trace.input_tokens += prompt_tokens
+                    trace.output_tokens += recipe_tokens
+        return recipes
+
+    # Take the next batch: block for the first request, then keep collecting
+    # requests with the same generation settings until the batch is full or
+    # max_wait has elapsed since the first one arrived.
+    def _next_batch(self):
+        if self._pending:
+            first = self._pending.pop(0)
+        else:
+            first = self._queue.get()
+        batch = [first]
+        leftovers = []
+
+        for request in self._pending:
+            if len(batch) < self.max_batch_size and request.key == first.key:
+                batch.append(request)
+            else:
+                leftovers.append(request)
+        self._pending = leftovers
+
+        deadline = first.enqueued + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if request.key == first.key:
+                batch.append(request)
+            else:
+                self._pending.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            batch = [r for r in batch if r.future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            traces = None
+            if any(r.trace is not None for r in batch):
+                started = time.perf_counter()
+                traces = [r.trace for r in batch]
+                for request in batch:
+                    if request.trace is not None:
+                        request.trace.queue_wait = started - request.enqueued
+            try:
+                outputs = self._generate_batch([r.prompt for r in batch], *batch[0].key, traces)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output)
+
+
+# One engine per loaded model/tokenizer pair
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+# Engine settings (max_batch_size, max_wait) only apply when the engine is created
+def engine_for(model, tokenizer, device, **settings):
+    key = (id(model), id(tokenizer))
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = BatchingEngine(model, tokenizer, device, **settings)
+            _engines[key] = engine
+        return engine
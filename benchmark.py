@@ -0,0 +1,144 @@
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from retrieval import DATASET_PATH, percentile, read_prompts
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def latency_summary(latencies):
+    return {f"p{q}_ms": percentile(latencies, q) * 1000 for q in (50, 95, 99)}
+
+
+def count_tokens(tokenizer, recipes):
+    return sum(len(ids) for ids in tokenizer(recipes, add_special_tokens=False)["input_ids"])
+
+
+# Online mode: `concurrency` clients each call generate_recipe; the batching
+# engine groups concurrent calls into batches of up to batch_size.
+def run_online(prompts, model, tokenizer, concurrency, batch_size, max_length, decoding="greedy"):
+    import recipe_model
+    from batching import engine_for
+
+    engine_for(model, tokenizer, model.device).max_batch_size = batch_size
+
+    def timed(prompt):
+        start = time.perf_counter()
+        recipe = recipe_model.generate_recipe(prompt, model, tokenizer, max_length, decoding)
+        return recipe, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(timed, prompts))
+    elapsed = time.perf_counter() - start
+    return [r for r, _ in results], [t for _, t in results], elapsed
+
+
+# Bulk mode: generate_recipes over the whole list in batches of batch_size
+def run_bulk(prompts, model, tokenizer, batch_size, max_length, decoding="greedy"):
+    import recipe_model
+    from batching import engine_for
+
+    engine_for(model, tokenizer, model.device).max_batch_size = batch_size
+    start = time.perf_counter()
+    recipes = recipe_model.generate_recipes(prompts, model, tokenizer, max_length, decoding)
+    elapsed = time.perf_counter() - start
+    # Every prompt in a batch finishes when its batch does
+    per_prompt = [elapsed / len(prompts)] * len(prompts)
+    return recipes, per_prompt, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recipe generation latency, throughput and memory")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--limit", type=int, default=200, help="prompts to replay per run")
+    parser.add_argument("--mode", choices=("online", "bulk"), default="online")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--batch-size", type=int, nargs="+", default=[1, 8, 16])
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--model-path", default=None)
+    parser.add_argument("--warmup", type=int, default=3, help="untimed prompts before each run")
+    parser.add_argument("--use-cache", action="store_true", help="keep the result cache enabled")
+    parser.add_argument("--encoder-cache-mb", type=float, default=0,
+                        help="encoder output cache size, emptied before each run (default: off)")
+    parser.add_argument("--use-retrieval", action="store_true", help="enable the retrieval fast path")
+    parser.add_argument("--output", default=None, help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    import encoder_cache
+    import recipe_model
+    import_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    model, tokenizer = recipe_model.load_model(args.model_path or recipe_model.MODEL_PATH, backend=args.backend)
+    load_time = time.perf_counter() - start
+
+    if args.use_retrieval:
+        recipe_model.configure_retrieval()
+
+    prompts = read_prompts(args.dataset, args.limit)
+    concurrency = args.concurrency if args.mode == "online" else [1]
+    runs = []
+    for clients in concurrency:
+        for batch_size in args.batch_size:
+            recipe_model.configure_cache(0)
+            if args.warmup:
+                recipe_model.generate_recipes(prompts[:args.warmup], model, tokenizer, args.max_length)
+            recipe_model.configure_cache(1024 if args.use_cache else 0)
+            encoder_cache.configure(int(args.encoder_cache_mb * (1 << 20)))
+
+            if args.mode == "online":
+                recipes, latencies, elapsed = run_online(prompts, model, tokenizer, clients, batch_size,
+                                                         args.max_length)
+            else:
+                recipes, latencies, elapsed = run_bulk(prompts, model, tokenizer, batch_size, args.max_length)
+
+            tokens = count_tokens(tokenizer, recipes)
+            run = {
+                "mode": args.mode,
+                "concurrency": clients,
+                "batch_size": batch_size,
+                "prompts": len(prompts),
+                "seconds": elapsed,
+                "prompts_per_sec": len(prompts) / elapsed,
+                "tokens_per_sec": tokens / elapsed,
+                "output_tokens": tokens,
+                "latency": latency_summary(latencies),
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            runs.append(run)
+            print(f"{args.mode} c={clients:<3} b={batch_size:<3} {run['prompts_per_sec']:8.2f} prompts/s "
+                  f"{run['tokens_per_sec']:9.1f} tok/s  p50 {run['latency']['p50_ms']:8.1f}ms "
+                  f"p99 {run['latency']['p99_ms']:8.1f}ms", file=sys.stderr)
+
+    report = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": getattr(model, "backend_name", "torch"),
+        "device": str(model.device),
+        "max_length": args.max_length,
+        "import_seconds": import_time,
+        "model_load_seconds": load_time,
+        "peak_rss_mb": peak_rss_mb(),
+        "runs": runs,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import argparse
+import csv
+import io
+import itertools
+import json
+import os
+import sys
+import time
+
+from decoding import DECODING_MODES
+
+PROMPT_COLUMN = "Prompt"
+RECIPE_COLUMN = "Generated Recipe"
+WRITE_BUFFER = 1 << 20
+
+
+def detect_format(path, override=None):
+    if override:
+        return override
+    return "jsonl" if path.endswith((".jsonl", ".ndjson")) else "csv"
+
+
+# Prompts streamed one row at a time, so memory stays flat for any input size
+def read_prompts(path, fmt):
+    with open(path, newline="", encoding="utf-8") as f:
+        if fmt == "jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)[PROMPT_COLUMN]
+        else:
+            for row in csv.DictReader(f):
+                yield row[PROMPT_COLUMN]
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def encode_rows(pairs, fmt):
+    if fmt == "jsonl":
+        return "".join(json.dumps({PROMPT_COLUMN: p, RECIPE_COLUMN: r}) + "\n" for p, r in pairs)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(pairs)
+    return buffer.getvalue()
+
+
+# Progress lives next to the output: rows done and the output size at that
+# point. Written atomically once the output up to that size is on disk, so a
+# restart truncates any half-written rows and skips exactly the finished ones.
+class Checkpoint:
+    def __init__(self, output):
+        self.path = output + ".progress"
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path) as f:
+            saved = json.load(f)
+        return saved["rows"], saved["offset"]
+
+    def save(self, rows, offset):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"rows": rows, "offset": offset}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def run(args):
+    import recipe_model
+
+    in_format = detect_format(args.input, args.input_format)
+    out_format = detect_format(args.output, args.output_format)
+    checkpoint = Checkpoint(args.output)
+    done, offset = checkpoint.load() if not args.restart else (0, 0)
+
+    pool = None
+    if args.workers:
+        from worker_pool import WorkerPool
+
+        # Each batch is split evenly across the worker processes
+        pool = WorkerPool(args.workers, args.threads_per_worker, backend=args.backend,
+                          chunk_size=-(-args.batch_size // args.workers))
+    else:
+        model, tokenizer = recipe_model.load_model(backend=args.backend)
+    recipe_model.configure_cache(0)  # keep memory flat; every prompt is new here anyway
+    if args.use_retrieval:
+        recipe_model.configure_retrieval()
+
+    resuming = done > 0 and os.path.exists(args.output)
+    out = open(args.output, "r+b" if resuming else "wb", buffering=WRITE_BUFFER)
+    if resuming:
+        # Drop anything written after the last checkpoint (e.g. a half-written batch)
+        out.truncate(offset)
+        out.seek(offset)
+        print(f"resuming after {done} rows", file=sys.stderr)
+    else:
+        done = 0
+        if out_format == "csv":
+            out.write(encode_rows([(PROMPT_COLUMN, RECIPE_COLUMN)], "csv").encode("utf-8"))
+
+    # Rows finished and the output size right after them, updated together
+    # once a batch is fully written. A failure mid-batch (e.g. Ctrl-C between
+    # the write and the row count) checkpoints the last consistent pair, so
+    # resuming truncates the partial batch instead of writing it twice.
+    progress = (done, out.tell())
+
+    def save_progress():
+        out.flush()
+        os.fsync(out.fileno())
+        checkpoint.save(*progress)
+
+    prompts = itertools.islice(read_prompts(args.input, in_format), done, None)
+    start = last_report = time.perf_counter()
+    generated = unsaved = 0
+    try:
+        for batch in batched(prompts, args.batch_size):
+            if pool is not None:
+                recipes = pool.generate(batch, args.max_length, args.decoding)
+            else:
+                recipes = recipe_model.generate_recipes(batch, model, tokenizer, args.max_length, args.decoding)
+            out.write(encode_rows(zip(batch, recipes), out_format).encode("utf-8"))
+            progress = (done + len(batch), out.tell())
+            done = progress[0]
+            generated += len(batch)
+            unsaved += len(batch)
+
+            if unsaved >= args.checkpoint_every:
+                save_progress()
+                unsaved = 0
+
+            now = time.perf_counter()
+            if now - last_report >= args.report_every:
+                last_report = now
+                print(f"{done} rows done, {generated / (now - start):.1f} prompts/s", file=sys.stderr)
+        out.flush()
+        os.fsync(out.fileno())
+    except BaseException:
+        # Keep whatever finished before the failure (including Ctrl-C)
+        save_progress()
+        raise
+    finally:
+        out.close()
+        if pool is not None:
+            pool.close()
+
+    checkpoint.remove()
+    elapsed = time.perf_counter() - start
+    rate = generated / elapsed if elapsed else 0.0
+    print(f"finished: {done} rows ({generated} this run) in {elapsed:.1f}s, {rate:.1f} prompts/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate recipes for a CSV/JSONL file of prompts")
+    parser.add_argument("input", help=f"CSV or JSONL file with a {PROMPT_COLUMN!r} column")
+    parser.add_argument("output", help="CSV or JSONL file to write; resumed if a checkpoint exists")
+    parser.add_argument("--input-format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--output-format", choices=("csv", "jsonl"), default=None)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument("--decoding", choices=DECODING_MODES, default="greedy")
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="generate in this many CPU worker processes (see worker_pool.py)")
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--use-retrieval", action="store_true", help="answer near-duplicates from the dataset")
+    parser.add_argument("--checkpoint-every", type=int, default=256, help="rows between checkpoints")
+    parser.add_argument("--report-every", type=float, default=10.0, help="seconds between progress lines")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint and start over")
+    args = parser.parse_args()
+    run(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+
+# Fingerprint a checkpoint directory so cached recipes from an older model are
+# never reused. File names, sizes and modification times stand in for the
+# contents, so the weights (hundreds of MB) are never read just to build a key.
+@lru_cache(maxsize=None)
+def checkpoint_hash(path):
+    digest = hashlib.sha256()
+    if not os.path.isdir(path):
+        digest.update(str(path).encode("utf-8"))
+        return digest.hexdigest()[:16]
+    for name in sorted(os.listdir(path)):
+        full = os.path.join(path, name)
+        if not os.path.isfile(full):
+            continue
+        stat = os.stat(full)
+        digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+# Cache key: normalized prompt + every setting that changes the decoded output
+def make_key(prompt, max_length, checkpoint, **decoding):
+    payload = json.dumps([prompt, max_length, checkpoint, sorted(decoding.items())], default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Two-tier result cache: an in-memory LRU with size/TTL eviction in front of an
+# optional SQLite file that survives restarts. Prompts must already be cleaned.
+class RecipeCache:
+    def __init__(self, capacity=1024, ttl=None, path=None):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # key -> (recipe, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS recipes "
+                             "(key TEXT PRIMARY KEY, recipe TEXT NOT NULL, stored_at REAL NOT NULL)")
+            self._db.commit()
+
+    def _expired(self, stored_at, now):
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                del self._entries[key]
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute("SELECT recipe, stored_at FROM recipes WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[1], now):
+                    self._insert(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key, recipe):
+        now = time.time()
+        with self._lock:
+            self._insert(key, recipe, now)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO recipes (key, recipe, stored_at) VALUES (?, ?, ?)",
+                                 (key, recipe, now))
+                self._db.commit()
+
+    def put_many(self, items):
+        now = time.time()
+        items = list(items)
+        with self._lock:
+            for key, recipe in items:
+                self._insert(key, recipe, now)
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO recipes (key, recipe, stored_at) VALUES (?, ?, ?)",
+                                     [(key, recipe, now) for key, recipe in items])
+                self._db.commit()
+
+    def _insert(self, key, recipe, stored_at):
+        self._entries[key] = (recipe, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM recipes")
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
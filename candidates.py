@@ -0,0 +1,127 @@
+import argparse
+import threading
+import time
+from collections import OrderedDict, deque
+
+# "sample" draws nucleus samples; "diverse-beam" runs group beam search with a
+# diversity penalty between groups. Both return all candidates from a single
+# model.generate call, so the prompt is encoded once.
+CANDIDATE_METHODS = ("sample", "diverse-beam")
+DEFAULT_CANDIDATES = 4
+BUFFER_CAPACITY = 256
+
+
+def candidate_kwargs(method, n):
+    if method == "sample":
+        return {"do_sample": True, "top_p": 0.9, "temperature": 0.8, "num_return_sequences": n}
+    if method == "diverse-beam":
+        return {"num_beams": n, "num_beam_groups": n, "diversity_penalty": 1.0, "num_return_sequences": n}
+    raise ValueError(f"Unknown candidate method {method!r}, expected one of {', '.join(CANDIDATE_METHODS)}")
+
+
+# Unseen candidates per prompt, so "try another" is answered without running
+# the model. Recipes already shown for a prompt are never handed out again.
+class CandidateBuffer:
+    def __init__(self, capacity=BUFFER_CAPACITY):
+        self.capacity = capacity
+        self._entries = OrderedDict()  # key -> (deque of unseen recipes, set of seen recipes)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = (deque(), set())
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+        self._entries.move_to_end(key)
+        return entry
+
+    def pop(self, key):
+        with self._lock:
+            unseen, seen = self._entry(key)
+            if not unseen:
+                self.misses += 1
+                return None
+            self.hits += 1
+            recipe = unseen.popleft()
+            seen.add(recipe)
+            return recipe
+
+    def mark_seen(self, key, recipe):
+        with self._lock:
+            unseen, seen = self._entry(key)
+            seen.add(recipe)
+            if recipe in unseen:
+                unseen.remove(recipe)
+
+    # Buffer new candidates, skipping any already seen or buffered
+    def add(self, key, recipes):
+        with self._lock:
+            unseen, seen = self._entry(key)
+            for recipe in recipes:
+                if recipe not in seen and recipe not in unseen:
+                    unseen.append(recipe)
+
+    def available(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return len(entry[0]) if entry is not None else 0
+
+    def stats(self):
+        with self._lock:
+            return {"prompts": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# Time for n candidates from one generate call vs n separate calls, and how
+# many distinct recipes each gives
+def measure(model, tokenizer, prompts, n=DEFAULT_CANDIDATES, max_length=150, method="sample"):
+    import torch
+    from text_utils import clean_text
+
+    together = separate = 0.0
+    distinct_together = distinct_separate = 0
+    for prompt in prompts:
+        inputs = tokenizer(clean_text(prompt), return_tensors="pt", truncation=True, max_length=128).to(model.device)
+        with torch.inference_mode():
+            start = time.perf_counter()
+            output = model.generate(**inputs, max_length=max_length, **candidate_kwargs(method, n))
+            together += time.perf_counter() - start
+            distinct_together += len(set(tokenizer.batch_decode(output, skip_special_tokens=True)))
+
+            # Separate calls take one sample each (beam groups need all n beams in one call)
+            single = dict(candidate_kwargs("sample", n), num_return_sequences=1)
+            recipes = set()
+            start = time.perf_counter()
+            for _ in range(n):
+                output = model.generate(**inputs, max_length=max_length, **single)
+                recipes.add(tokenizer.decode(output[0], skip_special_tokens=True))
+            separate += time.perf_counter() - start
+            distinct_separate += len(recipes)
+
+    count = len(prompts)
+    print(f"{count} prompts, {n} candidates each ({method})")
+    print(f"one call:       {together / count * 1000:8.1f} ms/prompt, {distinct_together / count:.2f} distinct")
+    print(f"{n} calls:        {separate / count * 1000:8.1f} ms/prompt, {distinct_separate / count:.2f} distinct")
+    print(f"speedup {separate / together:.2f}x; a buffered \"try another\" then costs no model time")
+
+
+def main():
+    import recipe_model
+    from retrieval import read_prompts
+
+    parser = argparse.ArgumentParser(description="Cost of N candidates in one generate call vs N separate calls")
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("-n", "--candidates", type=int, default=DEFAULT_CANDIDATES)
+    parser.add_argument("--method", choices=CANDIDATE_METHODS, default="sample")
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument("--backend", default=None)
+    args = parser.parse_args()
+
+    model, tokenizer = recipe_model.load_model(backend=args.backend)
+    measure(model, tokenizer, read_prompts(limit=args.limit), args.candidates, args.max_length, args.method)
+
+
+if __name__ == "__main__":
+    main()
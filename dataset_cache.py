@@ -0,0 +1,184 @@
+import argparse
+import csv
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import time
+from array import array
+
+from retrieval import DATASET_PATH
+from text_utils import CLEANING_VERSION, clean_text
+
+CACHE_DIR = './token_cache'
+FORMAT_VERSION = 1
+MAX_LENGTH = 128
+CHUNK_ROWS = 1024
+COLUMNS = ("prompts", "recipes")
+
+
+# Text whose ids stand in for the tokenizer's normalization and segmentation
+FINGERPRINT_PROBE = "dish ingredients olive oil tomato 250g instructions combine add cook thoroughly and serve hot"
+
+
+# Identifies a tokenizer by what it produces (its vocabulary and the ids of a
+# probe text) rather than its class, so the fast and SentencePiece tokenizers
+# of a checkpoint share one cache
+def tokenizer_fingerprint(tokenizer):
+    digest = hashlib.sha256()
+    for token, token_id in sorted(tokenizer.get_vocab().items(), key=lambda item: item[1]):
+        digest.update(f"{token_id}:{token}\n".encode("utf-8"))
+    digest.update(json.dumps(tokenizer(FINGERPRINT_PROBE)["input_ids"]).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+# Size and modification time stand in for the dataset contents, so opening
+# the cache never has to read a (possibly huge) CSV
+def dataset_fingerprint(dataset):
+    stat = os.stat(dataset)
+    return [os.path.abspath(dataset), stat.st_size, stat.st_mtime_ns]
+
+
+def cache_key(dataset, tokenizer, max_length=MAX_LENGTH):
+    payload = json.dumps([FORMAT_VERSION, CLEANING_VERSION, dataset_fingerprint(dataset),
+                          tokenizer_fingerprint(tokenizer), max_length])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+# Stream the CSV in chunks, clean and tokenize each chunk, and append the ids
+# to flat binary files with an offsets index per column. Memory use depends on
+# the chunk size only, not on the size of the dataset.
+def build(dataset, tokenizer, directory, max_length=MAX_LENGTH, chunk_rows=CHUNK_ROWS):
+    typecode = "H" if len(tokenizer) <= 1 << 16 else "I"
+    tmp = directory + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+
+    files = {}
+    for column in COLUMNS:
+        files[column] = (open(os.path.join(tmp, f"{column}.bin"), "wb"),
+                         open(os.path.join(tmp, f"{column}.idx"), "wb"))
+        array("Q", [0]).tofile(files[column][1])
+    ends = {column: 0 for column in COLUMNS}
+    rows = 0
+
+    def flush(chunk):
+        for column, texts in zip(COLUMNS, zip(*chunk)):
+            data, index = files[column]
+            encoded = tokenizer(list(texts), truncation=True, max_length=max_length)["input_ids"]
+            offsets = array("Q")
+            for ids in encoded:
+                array(typecode, ids).tofile(data)
+                ends[column] += len(ids)
+                offsets.append(ends[column])
+            offsets.tofile(index)
+
+    try:
+        with open(dataset, newline="", encoding="utf-8") as f:
+            chunk = []
+            for row in csv.DictReader(f):
+                chunk.append((clean_text(row["Prompt"]), clean_text(row["Generated Recipe"])))
+                if len(chunk) == chunk_rows:
+                    flush(chunk)
+                    rows += len(chunk)
+                    chunk = []
+            if chunk:
+                flush(chunk)
+                rows += len(chunk)
+    finally:
+        for data, index in files.values():
+            data.close()
+            index.close()
+
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump({
+            "format_version": FORMAT_VERSION,
+            "cleaning_version": CLEANING_VERSION,
+            "tokenizer": tokenizer_fingerprint(tokenizer),
+            "max_length": max_length,
+            "typecode": typecode,
+            "rows": rows,
+        }, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp, directory)
+
+
+def _map(path, typecode):
+    if os.path.getsize(path) == 0:
+        return None, memoryview(b"").cast(typecode)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return mapped, memoryview(mapped).cast(typecode)
+
+
+# Read-only view of a built cache. Token ids are memory-mapped, so opening is
+# instant and rows are sliced out of the page cache without copying.
+class TokenCache:
+    def __init__(self, directory):
+        with open(os.path.join(directory, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.rows = self.meta["rows"]
+        self._maps = []
+        self._columns = {}
+        for column in COLUMNS:
+            data_map, data = _map(os.path.join(directory, f"{column}.bin"), self.meta["typecode"])
+            index_map, offsets = _map(os.path.join(directory, f"{column}.idx"), "Q")
+            self._maps += [m for m in (data_map, index_map) if m is not None]
+            self._columns[column] = (data, offsets)
+
+    def __len__(self):
+        return self.rows
+
+    def _slice(self, column, i):
+        data, offsets = self._columns[column]
+        return data[offsets[i]:offsets[i + 1]]
+
+    # Token ids of row i as (prompt, recipe) memoryviews into the mapped files
+    def __getitem__(self, i):
+        if not 0 <= i < self.rows:
+            raise IndexError(i)
+        return self._slice("prompts", i), self._slice("recipes", i)
+
+    def close(self):
+        for column in list(self._columns):
+            for view in self._columns.pop(column):
+                view.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+
+# Open the cache for this dataset/tokenizer/cleaning version, building it on first use
+def open_cache(dataset, tokenizer, cache_dir=CACHE_DIR, max_length=MAX_LENGTH):
+    directory = os.path.join(cache_dir, cache_key(dataset, tokenizer, max_length))
+    if not os.path.exists(os.path.join(directory, "meta.json")):
+        build(dataset, tokenizer, directory, max_length)
+    return TokenCache(directory)
+
+
+def main():
+    from tokenization import load_tokenizer
+
+    parser = argparse.ArgumentParser(description="Pre-tokenize the recipe dataset into a memory-mapped cache")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--tokenizer", default="t5-small")
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--max-length", type=int, default=MAX_LENGTH)
+    args = parser.parse_args()
+
+    tokenizer = load_tokenizer(args.tokenizer)
+    start = time.perf_counter()
+    cache = open_cache(args.dataset, tokenizer, args.cache_dir, args.max_length)
+    print(f"{len(cache)} rows ready in {time.perf_counter() - start:.3f}s", file=sys.stderr)
+    cache.close()
+
+    start = time.perf_counter()
+    cache = open_cache(args.dataset, tokenizer, args.cache_dir, args.max_length)
+    print(f"reopened in {(time.perf_counter() - start) * 1000:.2f}ms", file=sys.stderr)
+    cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+import argparse
+import time
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList
+
+# "greedy" is the original decoding; "recipe" stops as soon as the recipe is
+# complete and caps the length from the prompt's ingredients; "recipe-constrained"
+# also only allows tokens from the prompt and the recipe template. "speculative"
+# produces the greedy output with drafted tokens (see speculative.py).
+DECODING_MODES = ("greedy", "recipe", "recipe-constrained", "speculative")
+
+# Recipes end with "... cook thoroughly and serve hot"
+END_PHRASE = "serve hot"
+# Words the model writes around the ingredients: "dish ingredients <ingredients>
+# instructions combine <ingredients> add <last> cook thoroughly and serve hot"
+TEMPLATE = "dish ingredients instructions combine add cook thoroughly and serve hot"
+CAP_MARGIN = 8
+
+
+# The ingredient list of a cleaned "... with a b c avoiding d" prompt
+def ingredient_segment(cleaned):
+    words = cleaned.split()
+    if "with" not in words:
+        return None
+    words = words[words.index("with") + 1:]
+    if "avoiding" in words:
+        words = words[:words.index("avoiding")]
+    return " ".join(words) or None
+
+
+# Stops each sequence once it ends with END_PHRASE or reaches its own length cap
+class RecipeStoppingCriteria(StoppingCriteria):
+    def __init__(self, end_ids, caps):
+        self.end_ids = torch.tensor(end_ids)
+        self.caps = torch.tensor(caps)
+
+    def __call__(self, input_ids, scores, **kwargs):
+        length = input_ids.shape[1]
+        done = length >= self.caps.to(input_ids.device)
+        n = len(self.end_ids)
+        if n and length >= n:
+            done |= (input_ids[:, -n:] == self.end_ids.to(input_ids.device)).all(dim=1)
+        return done
+
+
+_template_ids = {}
+
+
+def _template(tokenizer):
+    key = id(tokenizer)
+    if key not in _template_ids:
+        _template_ids[key] = (
+            tokenizer(END_PHRASE, add_special_tokens=False)["input_ids"],
+            tokenizer(TEMPLATE, add_special_tokens=False)["input_ids"],
+        )
+    return _template_ids[key]
+
+
+# Decoder length cap (including the decoder start token) for one cleaned prompt:
+# the template plus the ingredients written twice, with some slack
+def length_cap(tokenizer, cleaned, max_length):
+    segment = ingredient_segment(cleaned)
+    if segment is None:
+        return max_length
+    _, template_ids = _template(tokenizer)
+    ingredient_ids = tokenizer(segment, add_special_tokens=False)["input_ids"]
+    return min(max_length, 1 + len(template_ids) + 2 * len(ingredient_ids) + CAP_MARGIN)
+
+
+# Extra model.generate keyword arguments for a batch of cleaned prompts.
+# Speculative decoding has its own loop; through model.generate it is greedy.
+def generation_kwargs(mode, tokenizer, prompts, max_length):
+    if mode in (None, "greedy", "speculative"):
+        return {}
+    if mode not in DECODING_MODES:
+        raise ValueError(f"Unknown decoding mode {mode!r}, expected one of {', '.join(DECODING_MODES)}")
+
+    end_ids, template_ids = _template(tokenizer)
+    caps = [length_cap(tokenizer, p, max_length) for p in prompts]
+    kwargs = {"stopping_criteria": StoppingCriteriaList([RecipeStoppingCriteria(end_ids, caps)])}
+
+    if mode == "recipe-constrained":
+        always = set(template_ids) | {tokenizer.eos_token_id, tokenizer.pad_token_id}
+        allowed = [sorted(always | set(tokenizer(p, add_special_tokens=False)["input_ids"])) for p in prompts]
+        kwargs["prefix_allowed_tokens_fn"] = lambda batch_id, input_ids: allowed[batch_id]
+    return kwargs
+
+
+# Average decoder steps and latency per mode over the bundled prompts, with
+# how often each mode's output matches plain greedy decoding
+def measure(model, tokenizer, prompts, max_length=150):
+    from text_utils import clean_text
+
+    results = {}
+    for mode in DECODING_MODES:
+        if mode == "speculative":
+            continue  # same output as greedy; python speculative.py measures it
+        steps, seconds, outputs = 0, 0.0, []
+        for prompt in prompts:
+            cleaned = clean_text(prompt)
+            inputs = tokenizer(cleaned, return_tensors="pt", truncation=True, max_length=128).to(model.device)
+            start = time.perf_counter()
+            with torch.inference_mode():
+                output = model.generate(**inputs, max_length=max_length,
+                                        **generation_kwargs(mode, tokenizer, [cleaned], max_length))
+            seconds += time.perf_counter() - start
+            steps += output.shape[1] - 1  # minus the decoder start token
+            outputs.append(tokenizer.decode(output[0], skip_special_tokens=True))
+        results[mode] = (steps / len(prompts), seconds / len(prompts), outputs)
+
+    greedy_outputs = results["greedy"][2]
+    print(f"{'mode':<20}{'decoder steps':>15}{'latency ms':>12}{'same as greedy':>16}")
+    for mode, (steps, latency, outputs) in results.items():
+        same = sum(a == b for a, b in zip(outputs, greedy_outputs)) / len(prompts)
+        print(f"{mode:<20}{steps:>15.1f}{latency * 1000:>12.1f}{same:>16.1%}")
+
+
+def main():
+    import recipe_model
+    from retrieval import read_prompts
+
+    parser = argparse.ArgumentParser(description="Compare decoder steps and latency of the decoding modes")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--max-length", type=int, default=150)
+    args = parser.parse_args()
+
+    model, tokenizer = recipe_model.load_model()
+    measure(model, tokenizer, read_prompts(limit=args.limit), args.max_length)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import argparse
+import random
+import threading
+import time
+from collections import OrderedDict
+
+import torch
+from transformers.modeling_outputs import BaseModelOutput
+
+DEFAULT_MAX_BYTES = 64 << 20
+
+
+# Encoder hidden states per tokenized prompt, so a prompt seen before (with any
+# decoding settings: length, mode, candidates) skips the encoder. T5's encoder
+# is bidirectional, so every token's state depends on the whole prompt: only
+# exact repeats can be reused, not shared prefixes. Bounded by the bytes held,
+# least recently used first out.
+class EncoderCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # (model id, token ids) -> hidden states [length, d_model]
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.encoder_seconds = 0.0
+        self.encoded_tokens = 0
+        self.saved_tokens = 0
+
+    def _get(self, key):
+        with self._lock:
+            state = self._entries.get(key)
+            if state is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_tokens += state.shape[0]
+            return state
+
+    def _put(self, key, state):
+        size = state.numel() * state.element_size()
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old.numel() * old.element_size()
+            self._entries[key] = state
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted.numel() * evicted.element_size()
+                self.evictions += 1
+
+    # Encoder outputs for a right-padded batch: cached rows are reused and the
+    # rest are encoded together in one call
+    def encode(self, model, input_ids, attention_mask):
+        lengths = attention_mask.sum(dim=1).tolist()
+        keys = [(id(model), tuple(ids[:n])) for ids, n in zip(input_ids.tolist(), lengths)]
+        states = [self._get(key) for key in keys]
+
+        missing = [i for i, state in enumerate(states) if state is None]
+        if missing:
+            rows = torch.tensor(missing, device=input_ids.device)
+            start = time.perf_counter()
+            hidden = model.get_encoder()(input_ids=input_ids[rows], attention_mask=attention_mask[rows]).last_hidden_state
+            if hidden.device.type == "cuda":
+                torch.cuda.synchronize()
+            with self._lock:
+                self.encoder_seconds += time.perf_counter() - start
+                self.encoded_tokens += sum(lengths[i] for i in missing)
+            for row, i in enumerate(missing):
+                states[i] = hidden[row, :lengths[i]].clone()
+                self._put(keys[i], states[i])
+            if len(missing) == len(keys):
+                return BaseModelOutput(last_hidden_state=hidden)
+
+        first = states[0]
+        output = first.new_zeros((len(states), input_ids.shape[1], first.shape[-1]))
+        for i, state in enumerate(states):
+            output[i, :state.shape[0]] = state
+        return BaseModelOutput(last_hidden_state=output)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    # Time saved is estimated from the measured encoder cost per token
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            per_token = self.encoder_seconds / self.encoded_tokens if self.encoded_tokens else 0.0
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "encoder_seconds": self.encoder_seconds,
+                "saved_seconds": self.saved_tokens * per_token,
+            }
+
+
+# The process-wide cache used by generation (None disables it)
+active = EncoderCache()
+
+
+def configure(max_bytes=DEFAULT_MAX_BYTES):
+    global active
+    active = EncoderCache(max_bytes) if max_bytes > 0 else None
+    return active
+
+
+# ONNX Runtime models run their own encoder session inside generate
+def supported(model):
+    return getattr(model, "backend_name", "torch") != "onnx"
+
+
+# Encoder outputs for a batch, through the active cache when there is one
+def encode(model, input_ids, attention_mask):
+    cache = active
+    if cache is None:
+        return model.get_encoder()(input_ids=input_ids, attention_mask=attention_mask)
+    return cache.encode(model, input_ids, attention_mask)
+
+
+# Replay the CSV prompts, each requested with several decoding settings in
+# shuffled order (the result cache is off, so every request reaches the model)
+def replay(model, tokenizer, prompts, settings, seed=42):
+    import recipe_model
+
+    requests = [(prompt, max_length, decoding) for prompt in prompts for max_length, decoding in settings]
+    random.Random(seed).shuffle(requests)
+    start = time.perf_counter()
+    for prompt, max_length, decoding in requests:
+        recipe_model.generate_recipe(prompt, model, tokenizer, max_length, decoding)
+    elapsed = time.perf_counter() - start
+
+    stats = active.stats()
+    print(f"{len(requests)} requests ({len(prompts)} prompts x {len(settings)} settings) in {elapsed:.1f}s")
+    print(f"hit rate {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses, "
+          f"{stats['evictions']} evictions, {stats['bytes'] / (1 << 20):.1f} MiB held)")
+    print(f"encoder time {stats['encoder_seconds']:.2f}s, saved about {stats['saved_seconds']:.2f}s")
+
+
+def main():
+    import recipe_model
+    from retrieval import read_prompts
+
+    parser = argparse.ArgumentParser(description="Encoder cache hit rate and time saved on a replay of the CSV prompts")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--max-mb", type=float, default=DEFAULT_MAX_BYTES / (1 << 20))
+    parser.add_argument("--backend", default=None)
+    args = parser.parse_args()
+
+    configure(int(args.max_mb * (1 << 20)))
+    recipe_model.configure_cache(0)
+    model, tokenizer = recipe_model.load_model(backend=args.backend)
+    if not supported(model):
+        parser.error("the encoder cache needs the torch or int8 backend")
+    replay(model, tokenizer, read_prompts(limit=args.limit), [(150, "greedy"), (100, "greedy"), (150, "recipe")])
+
+
+if __name__ == "__main__":
+    main()
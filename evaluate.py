@@ -0,0 +1,178 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import tempfile
+from collections import Counter
+
+import encoder_cache
+from benchmark import count_tokens, latency_summary, run_bulk, run_online
+from decoding import DECODING_MODES
+from recipe_parser import parse_recipe
+from retrieval import DATASET_PATH
+from text_utils import clean_text
+from train import load_splits
+
+BLEU_ORDER = 4
+
+
+# Reference ingredient names, cleaned: "Ingredients: olive oil, tomato." -> ["olive oil", "tomato"]
+def reference_ingredients(reference):
+    recipe = parse_recipe(reference)
+    if recipe is None:
+        return []
+    return [name for name in (clean_text(item).strip() for item in recipe.ingredients) if name]
+
+
+# Fraction of the reference ingredients named in the generated ingredient list
+# (the whole output when it has no sections)
+def ingredient_recall(recipe, names):
+    if not names:
+        return 1.0
+    parsed = parse_recipe(recipe)
+    listed = " ".join(parsed.ingredients) if parsed is not None else recipe
+    listed = f" {listed} "
+    return sum(f" {name} " in listed for name in names) / len(names)
+
+
+def _ngrams(words, n):
+    return Counter(tuple(words[i:i + n]) for i in range(len(words) - n + 1))
+
+
+# Corpus BLEU-4 over whitespace tokens (uniform weights, brevity penalty, no smoothing)
+def corpus_bleu(hypotheses, references, order=BLEU_ORDER):
+    matches, totals = [0] * order, [0] * order
+    hypothesis_length = reference_length = 0
+    for hypothesis, reference in zip(hypotheses, references):
+        hypothesis, reference = hypothesis.split(), reference.split()
+        hypothesis_length += len(hypothesis)
+        reference_length += len(reference)
+        for n in range(1, order + 1):
+            counts = _ngrams(hypothesis, n)
+            matches[n - 1] += sum((counts & _ngrams(reference, n)).values())
+            totals[n - 1] += max(len(hypothesis) - n + 1, 0)
+    if not hypothesis_length or 0 in matches:
+        return 0.0
+    log_precision = sum(math.log(m / t) for m, t in zip(matches, totals)) / order
+    brevity = min(0.0, 1 - reference_length / hypothesis_length)
+    return math.exp(log_precision + brevity)
+
+
+def score(recipes, references):
+    cleaned = [clean_text(reference) for reference in references]
+    recall = [ingredient_recall(recipe, reference_ingredients(reference))
+              for recipe, reference in zip(recipes, references)]
+    return {
+        "ingredient_recall": sum(recall) / len(recall),
+        "exact_match": sum(r == c for r, c in zip(recipes, cleaned)) / len(recipes),
+        "bleu": corpus_bleu(recipes, cleaned),
+    }
+
+
+# Retrieval index over the training rows only, so held-out prompts are not
+# answered with their own reference recipes
+def configure_train_retrieval(train_rows):
+    import recipe_model
+
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", newline="", encoding="utf-8", delete=False) as f:
+        writer = csv.writer(f)
+        writer.writerow(("Prompt", "Generated Recipe"))
+        writer.writerows(train_rows)
+    try:
+        recipe_model.configure_retrieval(dataset=f.name, index_path=None)
+    finally:
+        os.remove(f.name)
+
+
+# One row per configuration; the first is the baseline for --max-bleu-drop
+def print_table(runs, budget=None):
+    print(f"{'backend':<8}{'decoding':<20}{'recall':>8}{'exact':>8}{'BLEU':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'prompts/s':>11}{'tok/s':>9}")
+    for run in runs:
+        print(f"{run['backend']:<8}{run['decoding']:<20}{run['ingredient_recall']:>8.1%}{run['exact_match']:>8.1%}"
+              f"{run['bleu'] * 100:>8.1f}{run['latency']['p50_ms']:>9.1f}{run['latency']['p95_ms']:>9.1f}"
+              f"{run['prompts_per_sec']:>11.2f}{run['tokens_per_sec']:>9.1f}")
+    if budget is not None:
+        floor = runs[0]["bleu"] - budget / 100
+        within = [run for run in runs if run["bleu"] >= floor]
+        best = max(within, key=lambda run: run["prompts_per_sec"])
+        print(f"fastest within {budget:g} BLEU of {runs[0]['backend']}/{runs[0]['decoding']}: "
+              f"{best['backend']}/{best['decoding']} ({best['prompts_per_sec']:.2f} prompts/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Quality and speed of generation configurations on the held-out split")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--limit", type=int, default=None, help="held-out prompts to evaluate (default: all)")
+    parser.add_argument("--backend", nargs="+", default=["torch"])
+    parser.add_argument("--decoding", nargs="+", choices=DECODING_MODES, default=["greedy"])
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument("--mode", choices=("online", "bulk"), default="online")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--warmup", type=int, default=3, help="untimed training prompts before each run")
+    parser.add_argument("--use-cache", action="store_true", help="keep the result cache enabled")
+    parser.add_argument("--use-retrieval", action="store_true",
+                        help="enable the retrieval fast path, indexed over the training split")
+    parser.add_argument("--encoder-cache-mb", type=float, default=0,
+                        help="encoder output cache size (default: off)")
+    parser.add_argument("--max-bleu-drop", type=float, default=None,
+                        help="quality budget: report the fastest configuration within this many BLEU points "
+                             "of the first")
+    parser.add_argument("--output", default=None, help="also write the results as JSON here")
+    args = parser.parse_args()
+
+    import recipe_model
+
+    train_rows, test_rows = load_splits(args.dataset)
+    test_rows = test_rows[:args.limit] if args.limit else test_rows
+    prompts = [prompt for prompt, _ in test_rows]
+    references = [recipe for _, recipe in test_rows]
+    warmup = [prompt for prompt, _ in train_rows[:args.warmup]]
+    if args.use_retrieval:
+        configure_train_retrieval(train_rows)
+
+    runs = []
+    for backend in args.backend:
+        model, tokenizer = recipe_model.load_model(backend=backend)
+        for decoding in args.decoding:
+            recipe_model.configure_cache(0)
+            encoder_cache.configure(int(args.encoder_cache_mb * (1 << 20)))
+            if warmup:
+                recipe_model.generate_recipes(warmup, model, tokenizer, args.max_length, decoding)
+            recipe_model.configure_cache(1024 if args.use_cache else 0)
+
+            if args.mode == "online":
+                recipes, latencies, elapsed = run_online(prompts, model, tokenizer, args.concurrency,
+                                                         args.batch_size, args.max_length, decoding)
+            else:
+                recipes, latencies, elapsed = run_bulk(prompts, model, tokenizer, args.batch_size,
+                                                       args.max_length, decoding)
+
+            run = {
+                "backend": backend,
+                "decoding": decoding,
+                "prompts": len(prompts),
+                **score(recipes, references),
+                "seconds": elapsed,
+                "prompts_per_sec": len(prompts) / elapsed,
+                "tokens_per_sec": count_tokens(tokenizer, recipes) / elapsed,
+                "latency": latency_summary(latencies),
+            }
+            runs.append(run)
+            print(f"{backend}/{decoding}: BLEU {run['bleu'] * 100:.1f}, {run['prompts_per_sec']:.2f} prompts/s",
+                  file=sys.stderr)
+
+    print(f"{len(prompts)} held-out prompts, {args.mode} mode, max length {args.max_length}"
+          f"{', result cache' if args.use_cache else ''}{', retrieval' if args.use_retrieval else ''}"
+          f"{', encoder cache' if args.encoder_cache_mb > 0 else ''}")
+    print_table(runs, args.max_bleu_drop)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(runs, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
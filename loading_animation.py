@@ -0,0 +1,129 @@
+import argparse
+import math
+import random
+import threading
+import time
+
+DOT_COUNT = 8
+DOT_RADIUS = 5
+STEP_DEGREES = 10
+FPS = 20
+
+
+# Loading animation: dots circling the middle of a canvas. Frames are driven
+# from the Tk event loop with after() (no background thread touching Tk), and
+# every frame's dot positions are computed once per canvas size.
+class LoadingAnimation:
+    def __init__(self, canvas, colors, fps=FPS):
+        self.canvas = canvas
+        self.colors = colors
+        self.interval = max(1, int(1000 / fps))  # frame-rate cap
+        self.running = False
+        self.dots = []
+        self.frames = []
+        self.frame = 0
+        self._job = None
+        self._size = None
+        self.canvas.bind("<Configure>", self._on_resize, add="+")
+
+    def start(self):
+        self.stop()
+        self.running = True
+        self.dots = [self.canvas.create_oval(0, 0, 0, 0, fill=random.choice(self.colors))
+                     for _ in range(DOT_COUNT)]
+        self._precompute(self.canvas.winfo_width(), self.canvas.winfo_height())
+        self.frame = 0
+        self._animate()
+
+    # Coordinates of every dot for each rotation step around the canvas centre
+    def _precompute(self, width, height):
+        self._size = (width, height)
+        centerx = width // 2
+        centery = height // 2
+        radius = (min(centerx, centery) - 10) * 0.7
+        self.frames = []
+        for step in range(0, 360, STEP_DEGREES):
+            coords = []
+            for i in range(DOT_COUNT):
+                angle = math.radians(i * (360 / DOT_COUNT) + step)
+                x = centerx + radius * round(math.cos(angle), 2)
+                y = centery + radius * round(math.sin(angle), 2)
+                coords.append((x - DOT_RADIUS, y - DOT_RADIUS, x + DOT_RADIUS, y + DOT_RADIUS))
+            self.frames.append(coords)
+
+    def _on_resize(self, event):
+        if self.running and (event.width, event.height) != self._size:
+            self._precompute(event.width, event.height)
+
+    def _animate(self):
+        if not self.running:
+            return
+        for dot, coords in zip(self.dots, self.frames[self.frame]):
+            self.canvas.coords(dot, *coords)
+        self.frame = (self.frame + 1) % len(self.frames)
+        self._job = self.canvas.after(self.interval, self._animate)
+
+    def stop(self):
+        self.running = False
+        if self._job is not None:
+            self.canvas.after_cancel(self._job)
+            self._job = None
+        self.canvas.delete("all")
+        self.dots = []
+
+
+# Time generations run on a worker thread (as the GUI does) while the Tk event
+# loop is idle or driving the animation
+def measure(prompts, model, tokenizer, with_animation):
+    import tkinter as tk
+    import recipe_model
+
+    root = tk.Tk()
+    canvas = tk.Canvas(root, width=400, height=50)
+    canvas.pack(fill="both", expand=True)
+    root.update()
+    animation = LoadingAnimation(canvas, ["#F2EFE7", "#9ACBD0", "#48A6A7", "#006A71"])
+    if with_animation:
+        animation.start()
+
+    times = []
+
+    def work():
+        for prompt in prompts:
+            start = time.perf_counter()
+            recipe_model.generate_recipe(prompt, model, tokenizer)
+            times.append(time.perf_counter() - start)
+        root.after(0, root.quit)
+
+    threading.Thread(target=work, daemon=True).start()
+    root.mainloop()
+    animation.stop()
+    root.destroy()
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generation time with and without the loading animation")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--encoder-cache-mb", type=float, default=0,
+                        help="encoder output cache size, emptied before each pass (default: off)")
+    args = parser.parse_args()
+
+    import encoder_cache
+    import recipe_model
+    from retrieval import percentile, read_prompts
+
+    recipe_model.configure_cache(0)
+    model, tokenizer = recipe_model.load_model()
+    prompts = read_prompts(limit=args.limit)
+    recipe_model.generate_recipe(prompts[0], model, tokenizer)  # warm up
+
+    for label, with_animation in (("without animation", False), ("with animation", True)):
+        encoder_cache.configure(int(args.encoder_cache_mb * (1 << 20)))
+        times = measure(prompts, model, tokenizer, with_animation)
+        print(f"{label:<18} mean {sum(times) / len(times) * 1000:8.1f}ms  "
+              f"p50 {percentile(times, 50) * 1000:8.1f}ms  p95 {percentile(times, 95) * 1000:8.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
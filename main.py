@@ -1,14 +1,16 @@
+from startup_timing import StartupTimer
+startup = StartupTimer()
+
 import tkinter as tk
 from tkinter import ttk, messagebox
 import ttkbootstrap as tb
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-import torch
-import re
 from PIL import Image, ImageTk
+import sys
 import threading
-import time
-import math
-import random
+from loading_animation import LoadingAnimation
+from recipe_parser import IncrementalRecipeParser, parse_recipe
+
+startup.mark("import")
 
 # Define color palette with the exact shades specified
 PRIMARY_COLOR = "#F2EFE7"    # Light cream
@@ -18,29 +20,20 @@ DARK_COLOR = "#006A71"       # Dark teal
 BG_COLOR = "#FFFFFF"         # White background
 TEXT_COLOR = "#333333"       # Dark gray for text
 
-# Load the fine-tuned model and tokenizer
-model = T5ForConditionalGeneration.from_pretrained('./final_model/final_model')
-tokenizer = T5Tokenizer.from_pretrained('./final_model/final_model')
-
-# Set the device for model (GPU or CPU)
-device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-model.to(device)
-
-# Clean Text
-def clean_text(text):
-    text = text.lower()  
-    text = re.sub(r'[^a-zA-Z0-9\s]', '', text)
-    return text
-
-# Function to generate recipe
-def generate_recipe(prompt, model, tokenizer, max_length=150):
-    prompt = clean_text(prompt)
-    inputs = tokenizer(prompt, return_tensors="pt", padding=True, truncation=True, max_length=128)
-    input_ids = inputs['input_ids'].to(device)
-    attention_mask = inputs['attention_mask'].to(device)
-
-    output = model.generate(input_ids, attention_mask=attention_mask, max_length=max_length, num_return_sequences=1)
-    return tokenizer.decode(output[0], skip_special_tokens=True)
+# The model is loaded on a background thread (see load_in_background) so the
+# window appears immediately; torch/transformers are imported there as well.
+recipe_model = None
+model, tokenizer = None, None
+# The last prompt, its generated output and the parsed structure (None if it has no sections)
+current_prompt = ""
+current_output = ""
+current_recipe = None
+# How the shown output was produced, so a saved "try another" candidate isn't
+# filed under the greedy result-cache key
+current_decoding = "greedy"
+# Why the recipe history couldn't be opened (see load_in_background)
+history_error = None
+TRY_ANOTHER_DECODING = "candidates:sample"  # next_candidate's default method, keyed as in recipe_model
 
 # Helper function to create rounded rectangle in Canvas (missing in the original Canvas class)
 def create_rounded_rectangle(canvas, x1, y1, x2, y2, radius=25, **kwargs):
@@ -84,6 +77,7 @@ class RoundedButton(tk.Canvas):
         self.bg_color = bg_color
         self.bg_color_darker = self._darken_color(bg_color, 0.15)
         self.command = command
+        self.enabled = True
         self.width = width
         self.height = height
         
@@ -114,19 +108,28 @@ class RoundedButton(tk.Canvas):
         return f"#{r:02x}{g:02x}{b:02x}"
     
     def _on_enter(self, event):
-        self.itemconfig(self.rounded_rect, fill=self.bg_color_darker)
+        if self.enabled:
+            self.itemconfig(self.rounded_rect, fill=self.bg_color_darker)
     
     def _on_leave(self, event):
-        self.itemconfig(self.rounded_rect, fill=self.bg_color)
+        if self.enabled:
+            self.itemconfig(self.rounded_rect, fill=self.bg_color)
     
     def _on_click(self, event):
-        self.itemconfig(self.rounded_rect, fill=self._darken_color(self.bg_color, 0.3))
+        if self.enabled:
+            self.itemconfig(self.rounded_rect, fill=self._darken_color(self.bg_color, 0.3))
     
     def _on_release(self, event):
+        if not self.enabled:
+            return
         self.itemconfig(self.rounded_rect, fill=self.bg_color_darker)
         if self.command:
             self.command()
             
+    def set_enabled(self, enabled):
+        self.enabled = enabled
+        self.itemconfig(self.rounded_rect, fill=self.bg_color if enabled else "#B0B0B0")
+            
     def config(self, **kwargs):
         if "command" in kwargs:
             self.command = kwargs["command"]
@@ -137,62 +140,27 @@ class RoundedButton(tk.Canvas):
             self.bg_color_darker = self._darken_color(kwargs["bg"], 0.15)
             self.itemconfig(self.rounded_rect, fill=kwargs["bg"])
 
-# Loading animation class
-class LoadingAnimation:
-    def __init__(self, canvas):
-        self.canvas = canvas
-        self.running = False
-        self.dots = []
-        self.colors = [PRIMARY_COLOR, SECONDARY_COLOR, ACCENT_COLOR, DARK_COLOR]
-        
-    def start(self):
-        self.running = True
-        self.canvas.delete("all")
-        self.dots = []
-        centerx = self.canvas.winfo_width() // 2
-        centery = self.canvas.winfo_height() // 2
-        radius = min(centerx, centery) - 10
-        
-        for i in range(8):
-            angle = i * (360 / 8)
-            x = centerx + radius * 0.7 * round(math.cos(math.radians(angle)), 2)
-            y = centery + radius * 0.7 * round(math.sin(math.radians(angle)), 2)
-            dot = self.canvas.create_oval(x-5, y-5, x+5, y+5, fill=random.choice(self.colors))
-            self.dots.append((dot, angle))
-        
-        threading.Thread(target=self._animate, daemon=True).start()
-    
-    def _animate(self):
-        step = 0
-        while self.running:
-            for dot, base_angle in self.dots:
-                angle = base_angle + step
-                centerx = self.canvas.winfo_width() // 2
-                centery = self.canvas.winfo_height() // 2
-                radius = min(centerx, centery) - 10
-                
-                x = centerx + radius * 0.7 * round(math.cos(math.radians(angle)), 2)
-                y = centery + radius * 0.7 * round(math.sin(math.radians(angle)), 2)
-                
-                self.canvas.coords(dot, x-5, y-5, x+5, y+5)
-            
-            step += 10
-            time.sleep(0.05)
-            try:
-                self.canvas.update()
-            except:
-                self.running = False
-    
-    def stop(self):
-        self.running = False
-        self.canvas.delete("all")
+# One generation at a time: Generate (and Enter) are ignored until the
+# current one has finished, so two streams never write into the pane at once
+generating = False
+
+def set_generating(active):
+    global generating
+    generating = active
+    generate_button.set_enabled(not active)
 
 # Function to handle button click with animation
 def on_generate():
+    if model is None:
+        messagebox.showinfo("Please wait", "The recipe model is still loading.")
+        return
+    if generating:
+        return
     prompt = prompt_entry.get()
     if not prompt.strip():
         messagebox.showwarning("Warning", "Please enter a recipe prompt.")
         return
+    set_generating(True)
     
     # Start loading animation
     result_text.config(state="normal")
@@ -203,48 +171,96 @@ def on_generate():
     loading_canvas.pack(fill="both", expand=True)
     loading_animation.start()
     
+    # Stream decoded text into the result pane as it arrives
+    parser = IncrementalRecipeParser()
+    pieces = []
+    started = False
+    
+    def show_piece(piece):
+        nonlocal started
+        pieces.append(piece)
+        if not started:
+            started = True
+            loading_animation.stop()
+            loading_canvas.pack_forget()
+            result_text.config(state="normal")
+            result_text.delete(1.0, "end")
+            result_text.config(state="disabled")
+        insert_events(parser.feed(piece))
+    
+    def finish():
+        if not started:
+            show_piece("")
+        # The streamed pane already has parse_recipe's layout; only the tail is left
+        insert_events(parser.finish())
+        set_current_recipe("".join(pieces), prompt)
+        set_generating(False)
+        show_buttons()
+        # Generate variations while the user reads this one, so "Try Another" is instant
+        threading.Thread(target=prefetch_variations, args=(prompt, current_output), daemon=True).start()
+        if "first generation" not in startup.marks:
+            startup.mark("first generation")
+            startup.report()
+    
     def generate_in_thread():
-        generated = generate_recipe(prompt, model, tokenizer)
-        app.after(0, lambda: display_result(generated))
+        try:
+            for piece in recipe_model.stream_recipe(prompt, model, tokenizer):
+                app.after(0, show_piece, piece)
+        except Exception as e:
+            app.after(0, show_error, e)
+            return
+        app.after(0, finish)
     
     threading.Thread(target=generate_in_thread, daemon=True).start()
 
-def display_result(result):
+# Insert parsed (text, tag) pieces at the end of the result pane
+def insert_events(events):
+    if not events:
+        return
+    result_text.config(state="normal")
+    for text, tag in events:
+        if tag == "replace":
+            # Start over with this text (e.g. the raw output when it has no sections)
+            result_text.delete(1.0, "end")
+            result_text.insert("end", text)
+        elif tag:
+            result_text.insert("end", text, tag)
+        else:
+            result_text.insert("end", text)
+    result_text.config(state="disabled")
+    result_text.see("end")
+
+def display_result(result, prompt="", decoding="greedy"):
     loading_animation.stop()
     loading_canvas.pack_forget()
     
-    # Add the result with fade-in effect
     result_text.config(state="normal")
     result_text.delete(1.0, "end")
-    
-    # Split result into sections (assuming format: Title, Ingredients, Instructions)
-    sections = re.split(r'(ingredients:|instructions:)', result, flags=re.IGNORECASE)
-    
-    if len(sections) >= 3:
-        # Title
-        result_text.insert("end", sections[0].strip() + "\n\n", "title")
-        
-        # Ingredients
-        result_text.insert("end", "INGREDIENTS:\n", "section_header")
-        ingredients = sections[2].strip().split('\n')
-        for ingredient in ingredients:
-            if ingredient.strip():
-                result_text.insert("end", "• " + ingredient.strip() + "\n", "ingredient")
-        result_text.insert("end", "\n")
-        
-        # Instructions
-        if len(sections) >= 5:
-            result_text.insert("end", "INSTRUCTIONS:\n", "section_header")
-            instructions = sections[4].strip().split('\n')
-            for i, instruction in enumerate(instructions):
-                if instruction.strip():
-                    result_text.insert("end", f"{i+1}. {instruction.strip()}\n", "instruction")
-    else:
-        # If parsing fails, just show the raw text
-        result_text.insert("end", result)
-    
     result_text.config(state="disabled")
     
+    recipe = set_current_recipe(result, prompt, decoding)
+    set_generating(False)
+    insert_events(recipe.events() if recipe is not None else [(result, "replace")])
+    show_buttons()
+
+def set_current_recipe(output, prompt="", decoding="greedy"):
+    global current_prompt, current_output, current_recipe, current_decoding
+    current_prompt = prompt
+    current_output = output
+    current_decoding = decoding
+    current_recipe = parse_recipe(output)
+    return current_recipe
+
+def show_error(error):
+    set_generating(False)
+    loading_animation.stop()
+    loading_canvas.pack_forget()
+    result_text.config(state="normal")
+    result_text.delete(1.0, "end")
+    result_text.config(state="disabled")
+    messagebox.showerror("Error", f"Failed to generate recipe: {str(error)}")
+
+def show_buttons():
     # Show save button at the center and try another button below it
     button_frame.pack(side="bottom", pady=20)
     save_button.pack(side="top", pady=5)
@@ -266,32 +282,61 @@ def fade_in_widget(widget, duration=10):
     
     update_alpha()
 
-# Function to save recipe
+# Function to save recipe to the history (written on a background thread,
+# so the window never waits on disk)
 def save_recipe():
-    recipe_text = result_text.get(1.0, "end-1c")
-    if not recipe_text:
+    if not current_output or recipe_model is None:
         return
-        
+    if recipe_model.history is None:
+        messagebox.showerror("Error", f"Recipe history is unavailable: {history_error or 'not opened'}")
+        return
+    future = recipe_model.save_to_history(current_prompt, current_output, model, decoding=current_decoding)
+    future.add_done_callback(lambda f: app.after(0, on_saved, f))
+
+def on_saved(future):
+    error = future.exception()
+    if error is not None:
+        messagebox.showerror("Error", f"Failed to save recipe: {str(error)}")
+    else:
+        messagebox.showinfo("Success", f"Recipe saved to history as #{future.result()}\n"
+                                       f"(python recipe_store.py show {future.result()})")
+
+def prefetch_variations(prompt, shown):
     try:
-        from datetime import datetime
-        now = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"recipe_{now}.txt"
-        
-        with open(filename, "w") as f:
-            f.write(recipe_text)
-        
-        messagebox.showinfo("Success", f"Recipe saved as {filename}")
-    except Exception as e:
-        messagebox.showerror("Error", f"Failed to save recipe: {str(e)}")
+        recipe_model.prefetch_candidates(prompt, model, tokenizer, shown=[shown])
+    except Exception:
+        pass  # "Try Another" will generate them itself
 
-# Function to clear for a new recipe
+# Function to show another recipe for the same prompt (change the prompt and
+# press Generate for a new one)
 def try_another():
-    prompt_entry.delete(0, "end")
+    prompt = current_prompt
+    if not prompt or model is None or generating:
+        return
+    set_generating(True)
+    shown, shown_decoding = current_output, current_decoding
+    button_frame.pack_forget()
     result_text.config(state="normal")
     result_text.delete(1.0, "end")
+    result_text.insert("end", "Finding another recipe...")
     result_text.config(state="disabled")
-    button_frame.pack_forget()
-    prompt_entry.focus_set()
+
+    def next_in_thread():
+        try:
+            recipe = recipe_model.next_candidate(prompt, model, tokenizer, shown=[shown])
+        except Exception as e:
+            app.after(0, show_error, e)
+            return
+        if recipe is None:
+            app.after(0, no_more_variations, shown, prompt, shown_decoding)
+        else:
+            app.after(0, display_result, recipe, prompt, TRY_ANOTHER_DECODING)
+
+    threading.Thread(target=next_in_thread, daemon=True).start()
+
+def no_more_variations(shown, prompt, decoding="greedy"):
+    display_result(shown, prompt, decoding)
+    messagebox.showinfo("Try Another", "No other variations found for this prompt.")
 
 # Title in header
 header_frame = tb.Frame(app, style="HeaderFrame.TFrame")
@@ -387,7 +432,7 @@ generate_button.pack(pady=20)
 # Loading canvas for animation
 loading_canvas = tk.Canvas(content_frame, height=50, bg=BG_COLOR, 
                         highlightthickness=0)
-loading_animation = LoadingAnimation(loading_canvas)
+loading_animation = LoadingAnimation(loading_canvas, [PRIMARY_COLOR, SECONDARY_COLOR, ACCENT_COLOR, DARK_COLOR])
 
 # Result area
 result_frame = tb.Frame(content_frame, style="TFrame")
@@ -525,7 +570,7 @@ class ToolTip:
 ToolTip(generate_button, "Click to generate a recipe based on your input")
 ToolTip(prompt_entry, "Enter ingredients, cuisine type, or dietary preferences")
 
-# Add a welcome animation
+# Add a welcome animation (scheduled with after() so the event loop keeps running)
 def welcome_animation():
     # Create and place welcome overlay
     overlay = tk.Canvas(app, bg=DARK_COLOR, highlightthickness=0)
@@ -538,18 +583,62 @@ def welcome_animation():
                                fill="white", font=("Helvetica", 16))
     
     # Animate fade out
-    for i in range(10, -1, -1):
+    def fade(i):
+        if i < 0:
+            overlay.destroy()
+            return
         alpha = i/10
         overlay.configure(bg=f"#{int(int(DARK_COLOR[1:3], 16)*alpha):02x}"
                           f"{int(int(DARK_COLOR[3:5], 16)*alpha):02x}"
                           f"{int(int(DARK_COLOR[5:7], 16)*alpha):02x}")
-        app.update()
-        time.sleep(0.25)
+        app.after(250, fade, i - 1)
+    
+    fade(10)
+
+# Load torch, the tokenizer and the model without blocking the window
+def load_in_background():
+    try:
+        import recipe_model as loaded_module
+        startup.mark("torch import")
+        loaded_model, loaded_tokenizer = loaded_module.load_model(timer=startup)
+    except Exception as e:
+        app.after(0, messagebox.showerror, "Error", f"Failed to load the recipe model: {str(e)}")
+        return
+    # A broken or unreadable dataset only disables the retrieval fast path
+    try:
+        loaded_module.configure_retrieval()
+        startup.mark("retrieval index")
+    except Exception as e:
+        print(f"retrieval fast path disabled: {e}", file=sys.stderr)
+    # Generation works without the history (e.g. a read-only working directory);
+    # Save explains why it is unavailable
+    loaded_history_error = None
+    try:
+        loaded_module.configure_history()
+        startup.mark("recipe history")
+    except Exception as e:
+        loaded_history_error = str(e)
     
-    overlay.destroy()
+    def on_model_ready():
+        global recipe_model, model, tokenizer, history_error
+        recipe_model, model, tokenizer = loaded_module, loaded_model, loaded_tokenizer
+        history_error = loaded_history_error
+        generate_button.set_enabled(True)
+        generate_button.config(text="Generate Recipe")
+        startup.report()
+    
+    app.after(0, on_model_ready)
+
+# Generate is enabled once the model is ready
+generate_button.set_enabled(False)
+generate_button.config(text="Loading model...")
+threading.Thread(target=load_in_background, daemon=True).start()
+
+# Record when the window is first drawn
+app.after_idle(lambda: startup.mark("first paint"))
 
 # Run the welcome animation after a short delay
 app.after(200, welcome_animation)
 
 # Run the app
-app.mainloop()
\ No newline at end of file
+app.mainloop()
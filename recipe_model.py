@@ -0,0 +1,322 @@
+from transformers import T5ForConditionalGeneration, TextIteratorStreamer
+import torch
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import backends
+from batching import engine_for
+import encoder_cache
+import recipe_store
+import retrieval
+import speculative
+import tracing
+from cache import RecipeCache, checkpoint_hash, make_key
+from candidates import DEFAULT_CANDIDATES, CandidateBuffer
+from decoding import generation_kwargs
+from text_utils import clean_text, clean_texts
+from tokenization import load_tokenizer
+
+MODEL_PATH = './final_model/final_model'
+
+# Set the device for model (GPU or CPU)
+device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+# Results of greedy decoding are deterministic, so they are cached by default
+cache = RecipeCache()
+
+# Replace the result cache, e.g. to add a persistent SQLite tier (capacity=0 disables caching)
+def configure_cache(capacity=1024, ttl=None, path=None):
+    global cache
+    if cache is not None:
+        cache.close()
+    cache = RecipeCache(capacity, ttl, path) if capacity > 0 else None
+    return cache
+
+# Optional retrieval fast path over the bundled dataset (see configure_retrieval)
+retrieval_index = None
+
+def configure_retrieval(threshold=retrieval.DEFAULT_THRESHOLD, dataset=retrieval.DATASET_PATH,
+                        index_path=retrieval.INDEX_PATH):
+    global retrieval_index
+    retrieval_index = retrieval.RecipeIndex.load_or_build(dataset, index_path, threshold) if threshold else None
+    return retrieval_index
+
+# Saved-recipe history (see configure_history); its newest entries warm the result cache
+history = None
+
+def configure_history(path=recipe_store.STORE_PATH):
+    global history
+    if history is not None:
+        history.close()
+    history = recipe_store.open_store(path) if path else None
+    if history is not None and cache is not None:
+        cache.put_many(history.cache_items(cache.capacity))
+    return history
+
+# Queue a generated recipe for the history; returns a Future for its id
+def save_to_history(prompt, recipe, model, max_length=150, decoding="greedy"):
+    backend = getattr(model, "backend_name", "torch")
+    version = f"{checkpoint_hash(model.config._name_or_path)}/{backend}"
+    return history.save(prompt, recipe, version, _cache_key(clean_text(prompt), model, max_length, decoding))
+
+# Inference backend: "torch" (fp32), "int8" (dynamically quantized) or "onnx" (ONNX Runtime)
+BACKEND = os.environ.get("DISHCRAFTER_BACKEND", "torch")
+
+# Load the fine-tuned model and tokenizer. Weights are memory-mapped when the
+# checkpoint has a model.safetensors file (see convert_to_safetensors).
+# `torch_device` overrides the default device (e.g. "cpu" for a process pool).
+def load_model(path=MODEL_PATH, timer=None, backend=None, torch_device=None):
+    backend = backend or BACKEND
+    if backend not in backends.BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {', '.join(backends.BACKENDS)}")
+
+    tokenizer = load_tokenizer(path)
+    if timer:
+        timer.mark("tokenizer load")
+
+    if backend == "onnx":
+        model = backends.load_onnx(path)
+    else:
+        use_safetensors = os.path.exists(os.path.join(path, "model.safetensors")) or None
+        model = T5ForConditionalGeneration.from_pretrained(path, low_cpu_mem_usage=True,
+                                                           use_safetensors=use_safetensors)
+        model.eval()
+        model = backends.quantize_int8(model) if backend == "int8" else model.to(torch_device or device)
+    model.backend_name = backend
+    checkpoint_hash(model.config._name_or_path)  # cache-key fingerprint, computed here rather than on the first request
+    if timer:
+        timer.mark("model load")
+    return model, tokenizer
+
+# Re-save a checkpoint with safetensors weights so later loads can mmap them
+def convert_to_safetensors(path=MODEL_PATH):
+    model = T5ForConditionalGeneration.from_pretrained(path)
+    model.save_pretrained(path, safe_serialization=True)
+
+def _cache_key(prompt, model, max_length, decoding="greedy"):
+    return make_key(prompt, max_length, checkpoint_hash(model.config._name_or_path),
+                    backend=getattr(model, "backend_name", "torch"), decoding=decoding,
+                    num_return_sequences=1)
+
+# Function to generate recipe (concurrent calls are micro-batched by the engine)
+def generate_recipe(prompt, model, tokenizer, max_length=150, decoding="greedy"):
+    trace = tracing.begin()
+    with tracing.stage(trace, "clean"):
+        prompt = clean_text(prompt)
+    results = cache
+    if results is not None:
+        key = _cache_key(prompt, model, max_length, decoding)
+        recipe = results.get(key)
+        if recipe is not None:
+            tracing.finish(trace, "cache")
+            return recipe
+
+    index = retrieval_index
+    if index is not None:
+        start = time.perf_counter()
+        recipe = index.lookup(prompt)
+        if recipe is not None:
+            index.stats.record("retrieval", time.perf_counter() - start)
+            tracing.finish(trace, "retrieval")
+            return recipe
+
+    recipe = engine_for(model, tokenizer, model.device).submit(prompt, max_length, decoding, trace).result()
+    if index is not None:
+        index.stats.record("model", time.perf_counter() - start)
+    if results is not None:
+        results.put(key, recipe)
+    tracing.finish(trace, "model")
+    return recipe
+
+class GenerationCancelled(Exception):
+    pass
+
+# Streamer that aborts generation at its next token once the consumer is gone
+class _CancellableStreamer(TextIteratorStreamer):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cancelled = threading.Event()
+
+    def put(self, value):
+        if self.cancelled.is_set():
+            raise GenerationCancelled()
+        super().put(value)
+
+# Streaming variant: yields decoded text pieces as the decoder produces them.
+# Cached and retrieved recipes are yielded whole; the full text is cached once decoding ends.
+def stream_recipe(prompt, model, tokenizer, max_length=150, decoding="greedy"):
+    trace = tracing.begin()
+    with tracing.stage(trace, "clean"):
+        prompt = clean_text(prompt)
+    results = cache
+    if results is not None:
+        key = _cache_key(prompt, model, max_length, decoding)
+        recipe = results.get(key)
+        if recipe is not None:
+            tracing.finish(trace, "cache")
+            yield recipe
+            return
+
+    index = retrieval_index
+    if index is not None:
+        start = time.perf_counter()
+        recipe = index.lookup(prompt)
+        if recipe is not None:
+            index.stats.record("retrieval", time.perf_counter() - start)
+            tracing.finish(trace, "retrieval")
+            yield recipe
+            return
+
+    with tracing.stage(trace, "tokenize"):
+        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=128)
+    streamer = _CancellableStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+    extra = generation_kwargs(decoding, tokenizer, [prompt], max_length)
+    errors = []
+
+    def run():
+        try:
+            # Encoding and decoding overlap with the consumer here, so they are
+            # reported together as the decoder stage
+            with tracing.stage(trace, "decoder"):
+                if decoding == "speculative" and speculative.supported(model):
+                    speculative.generate(model, tokenizer, prompt, max_length, streamer=streamer)
+                    return
+                with torch.inference_mode():
+                    input_ids = inputs['input_ids'].to(model.device)
+                    attention_mask = inputs['attention_mask'].to(model.device)
+                    if encoder_cache.supported(model):
+                        extra["encoder_outputs"] = encoder_cache.encode(model, input_ids, attention_mask)
+                    model.generate(input_ids, attention_mask=attention_mask,
+                                   max_length=max_length, num_return_sequences=1, streamer=streamer, **extra)
+        except GenerationCancelled:
+            streamer.end()
+        except Exception as e:
+            errors.append(e)
+            streamer.end()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    pieces = []
+    finished = False
+    try:
+        for piece in streamer:
+            if piece:
+                pieces.append(piece)
+                yield piece
+        finished = True
+    finally:
+        if not finished:
+            # Closed early (e.g. the client disconnected): stop decoding at the next token
+            streamer.cancelled.set()
+        thread.join()
+    if errors:
+        raise errors[0]
+    if index is not None:
+        index.stats.record("model", time.perf_counter() - start)
+    if results is not None:
+        results.put(key, "".join(pieces))
+    tracing.finish(trace, "model")
+
+# Alternative recipes per prompt for "try another" (see next_candidate)
+candidate_buffer = CandidateBuffer()
+_refills = {}  # buffer key -> Future of the refill in progress
+_refills_lock = threading.Lock()
+
+def _candidate_key(prompt, model, max_length, method):
+    return _cache_key(prompt, model, max_length, "candidates:" + method)
+
+# n candidate recipes from a single generate call, so the prompt is encoded once
+def generate_candidates(prompt, model, tokenizer, n=DEFAULT_CANDIDATES, max_length=150, method="sample"):
+    return engine_for(model, tokenizer, model.device).generate_candidates(clean_text(prompt), n, max_length, method)
+
+# Generate a batch of candidates into the buffer; concurrent refills of the
+# same prompt wait for the one already running
+def _refill(prompt, key, model, tokenizer, n, max_length, method):
+    with _refills_lock:
+        future = _refills.get(key)
+        running = future is not None
+        if not running:
+            future = _refills[key] = Future()
+    if running:
+        future.result()
+        return
+    try:
+        recipes = engine_for(model, tokenizer, model.device).generate_candidates(prompt, n, max_length, method)
+        candidate_buffer.add(key, recipes)
+        future.set_result(None)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _refills_lock:
+            del _refills[key]
+
+# Fill the buffer ahead of time (e.g. while the first recipe is being read);
+# `shown` are recipes already displayed for this prompt
+def prefetch_candidates(prompt, model, tokenizer, shown=(), n=DEFAULT_CANDIDATES, max_length=150, method="sample"):
+    prompt = clean_text(prompt)
+    key = _candidate_key(prompt, model, max_length, method)
+    for recipe in shown:
+        candidate_buffer.mark_seen(key, recipe)
+    if not candidate_buffer.available(key):
+        _refill(prompt, key, model, tokenizer, n, max_length, method)
+
+# Next recipe for a prompt that hasn't been shown yet: from the buffer when
+# possible, otherwise from a new batch of n candidates. None if the model
+# keeps producing recipes that were already shown.
+def next_candidate(prompt, model, tokenizer, shown=(), n=DEFAULT_CANDIDATES, max_length=150, method="sample"):
+    prompt = clean_text(prompt)
+    key = _candidate_key(prompt, model, max_length, method)
+    for recipe in shown:
+        candidate_buffer.mark_seen(key, recipe)
+    recipe = candidate_buffer.pop(key)
+    for _ in range(2):
+        if recipe is not None:
+            break
+        _refill(prompt, key, model, tokenizer, n, max_length, method)
+        recipe = candidate_buffer.pop(key)
+    return recipe
+
+# Bulk API for offline jobs: generates in full padded batches, results in input order
+def generate_recipes(prompts, model, tokenizer, max_length=150, decoding="greedy"):
+    trace = tracing.begin(len(prompts))
+    with tracing.stage(trace, "clean"):
+        prompts = clean_texts(prompts)
+    output = [None] * len(prompts)
+    missing = {}  # cleaned prompt -> indices still to generate
+    results = cache
+
+    index = retrieval_index
+    fallbacks = 0  # prompts the retrieval index couldn't answer
+    for i, prompt in enumerate(prompts):
+        recipe = results.get(_cache_key(prompt, model, max_length, decoding)) if results is not None else None
+        if recipe is None and index is not None:
+            start = time.perf_counter()
+            recipe = index.lookup(prompt)
+            if recipe is not None:
+                index.stats.record("retrieval", time.perf_counter() - start)
+            else:
+                fallbacks += 1
+        if recipe is None:
+            missing.setdefault(prompt, []).append(i)
+        else:
+            output[i] = recipe
+
+    if missing:
+        todo = list(missing)
+        start = time.perf_counter()
+        recipes = engine_for(model, tokenizer, model.device).generate_many(todo, max_length, decoding, trace)
+        if index is not None:
+            # Batched together, so each fallback is charged an equal share of the generation time
+            share = (time.perf_counter() - start) / fallbacks if fallbacks else 0.0
+            for _ in range(fallbacks):
+                index.stats.record("model", share)
+        if results is not None:
+            results.put_many((_cache_key(p, model, max_length, decoding), r) for p, r in zip(todo, recipes))
+        for prompt, recipe in zip(todo, recipes):
+            for i in missing[prompt]:
+                output[i] = recipe
+    tracing.finish(trace, "bulk")
+    return output
@@ -0,0 +1,218 @@
+import argparse
+import csv
+import json
+import re
+import time
+
+# Section words, matched case-insensitively. The model is trained on cleaned
+# text, so its output usually has no colons ("dish ingredients ... instructions ...").
+SECTION_PATTERN = re.compile(r'\b(?:ingredients|instructions)\b:?', re.IGNORECASE)
+ITEM_PATTERN = re.compile(r'[,\n]')
+STEP_PATTERN = re.compile(r'\n')
+# Word characters at the end of streamed text, which the next piece may turn into a section word
+PARTIAL_WORD_PATTERN = re.compile(r'\w*\Z')
+_ENCODER = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+TITLE, INGREDIENTS, INSTRUCTIONS = range(3)
+
+
+# Parses recipe text as it streams in and emits (text, tag) pieces for the
+# result pane as soon as they are final. It follows parse_recipe's rules (the
+# same section words, items and steps), so the streamed pane ends up exactly as
+# Recipe.events() lays it out. If the output never contains a section word,
+# finish() emits the raw text with the "replace" tag so the caller can show it as-is.
+class IncrementalRecipeParser:
+    def __init__(self):
+        self.buffer = ""
+        self.raw = []
+        self.state = TITLE
+        self.title_started = False
+        self.steps = 0
+
+    def feed(self, chunk):
+        self.raw.append(chunk)
+        self.buffer += chunk
+        events = []
+        self._consume(events, final=False)
+        return events
+
+    def finish(self):
+        events = []
+        self._consume(events, final=True)
+        if self.state == TITLE:
+            return [("".join(self.raw), "replace")]
+        if self.state == INGREDIENTS:
+            events.append(("\n", None))
+        return events
+
+    # Emit everything in the buffer that later text can't change
+    def _consume(self, events, final):
+        # Like parse_recipe, only the first two section words split the text
+        while self.state != INSTRUCTIONS:
+            match = SECTION_PATTERN.search(self.buffer)
+            # A section word at the very end may still be followed by a colon or more letters
+            if match is None or (not final and match.end() == len(self.buffer) and match.group()[-1] != ":"):
+                break
+            self._emit(self.buffer[:match.start()], events, final=True)
+            self.buffer = self.buffer[match.end():]
+            self._next_section(events)
+
+        if final:
+            end = len(self.buffer)
+        elif self.state == TITLE:
+            # Hold back a word that could become a section word, and trailing
+            # whitespace since it might end the title
+            end = len(self.buffer[:PARTIAL_WORD_PATTERN.search(self.buffer).start()].rstrip())
+        else:
+            # Items end at a separator; the text after the last one may still grow
+            pattern = ITEM_PATTERN if self.state == INGREDIENTS else STEP_PATTERN
+            separators = [m.end() for m in pattern.finditer(self.buffer)]
+            end = separators[-1] if separators else 0
+        if end:
+            self._emit(self.buffer[:end], events, final)
+            self.buffer = self.buffer[end:]
+
+    def _next_section(self, events):
+        if self.state == TITLE:
+            events.append(("\n\n", "title"))
+            events.append(("INGREDIENTS:\n", "section_header"))
+            self.state = INGREDIENTS
+        else:
+            events.append(("\n", None))
+            self.state = INSTRUCTIONS
+
+    def _emit(self, text, events, final):
+        if self.state == TITLE:
+            if not self.title_started:
+                text = text.lstrip()
+            if final:
+                text = text.rstrip()
+            if text:
+                self.title_started = True
+                events.append((text, "title"))
+        elif self.state == INGREDIENTS:
+            events += [("• " + item + "\n", "ingredient") for item in _items(text, ITEM_PATTERN)]
+        else:
+            for step in _items(text, STEP_PATTERN):
+                if not self.steps:
+                    events.append(("INSTRUCTIONS:\n", "section_header"))
+                self.steps += 1
+                events.append((f"{self.steps}. {step}\n", "instruction"))
+
+
+# A finished recipe split into its parts: a title, the ingredient names and
+# the instruction steps
+class Recipe:
+    __slots__ = ("title", "ingredients", "steps")
+
+    def __init__(self, title, ingredients, steps):
+        self.title = title
+        self.ingredients = ingredients
+        self.steps = steps
+
+    def __eq__(self, other):
+        return (isinstance(other, Recipe) and self.title == other.title
+                and self.ingredients == other.ingredients and self.steps == other.steps)
+
+    def __repr__(self):
+        return f"Recipe(title={self.title!r}, ingredients={self.ingredients!r}, steps={self.steps!r})"
+
+    def to_dict(self):
+        return {"title": self.title, "ingredients": self.ingredients, "steps": self.steps}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["title"], list(data["ingredients"]), list(data["steps"]))
+
+    def to_json(self):
+        return _ENCODER.encode(self.to_dict())
+
+    @classmethod
+    def from_json(cls, text):
+        return cls.from_dict(json.loads(text))
+
+    # (text, tag) pieces for the result pane, in the same layout as the
+    # streaming parser
+    def events(self):
+        events = [(self.title + "\n\n", "title"), ("INGREDIENTS:\n", "section_header")]
+        events += [("• " + item + "\n", "ingredient") for item in self.ingredients]
+        events.append(("\n", None))
+        if self.steps:
+            events.append(("INSTRUCTIONS:\n", "section_header"))
+            events += [(f"{i}. {step}\n", "instruction") for i, step in enumerate(self.steps, 1)]
+        return events
+
+    def to_text(self):
+        return "".join(text for text, _ in self.events())
+
+
+def _items(text, pattern):
+    items = []
+    for item in pattern.split(text):
+        item = item.strip().rstrip(".").strip()
+        if item:
+            items.append(item)
+    return items
+
+
+# Parse a finished model output in one pass over the text. Returns None when it
+# has no sections, in which case callers show the raw text.
+def parse_recipe(text):
+    sections = SECTION_PATTERN.split(text, 2)
+    if len(sections) < 2:
+        return None
+    steps = _items(sections[2], STEP_PATTERN) if len(sections) > 2 else []
+    return Recipe(sections[0].strip(), _items(sections[1], ITEM_PATTERN), steps)
+
+
+# Parsing cost over every recipe in the CSV, next to the old re.split of the
+# display code
+def benchmark(recipes, repeat=5):
+    def old_split(text):
+        return re.split(r'(ingredients:|instructions:)', text, flags=re.IGNORECASE)
+
+    def best(func):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for text in recipes:
+                func(text)
+            times.append(time.perf_counter() - start)
+        return min(times) / len(recipes)
+
+    parsed = [parse_recipe(text) for text in recipes]
+    structured = sum(recipe is not None for recipe in parsed)
+    old = best(old_split)
+    new = best(parse_recipe)
+    overhead = best(lambda text: None)
+    serialized = [recipe for recipe in parsed if recipe is not None]
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for recipe in serialized:
+            recipe.to_json()
+    to_json = (time.perf_counter() - start) / repeat / max(1, len(serialized))
+
+    print(f"{len(recipes)} recipes, {structured} with sections")
+    print(f"re.split (display code): {(old - overhead) * 1e6:7.2f} us/recipe")
+    print(f"parse_recipe:            {(new - overhead) * 1e6:7.2f} us/recipe")
+    print(f"Recipe.to_json:          {to_json * 1e6:7.2f} us/recipe")
+
+
+def main():
+    from retrieval import DATASET_PATH
+    from text_utils import clean_text
+
+    parser = argparse.ArgumentParser(description="Benchmark recipe parsing over the bundled CSV")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--cleaned", action="store_true", help="parse the recipes as the model writes them")
+    args = parser.parse_args()
+
+    with open(args.dataset, newline="", encoding="utf-8") as f:
+        recipes = [row["Generated Recipe"] for row in csv.DictReader(f)]
+    if args.cleaned:
+        recipes = [clean_text(recipe) for recipe in recipes]
+    benchmark(recipes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from recipe_parser import Recipe, parse_recipe
+
+STORE_PATH = './recipe_history.db'
+MAX_BATCH = 256
+COMMIT_INTERVAL = 0.05  # seconds the writer waits to gather more records per commit
+
+COLUMNS = ("id", "saved_at", "prompt", "recipe", "parsed", "model_version", "cache_key")
+
+
+class _Record:
+    __slots__ = ("values", "future")
+
+    def __init__(self, values):
+        self.values = values
+        self.future = Future()
+
+
+# Saved recipes in a local SQLite database. Saving only queues the record: a
+# background thread writes queued records in batches, one commit per batch,
+# so callers (e.g. the Tk main thread) never wait on disk. History can be
+# searched (full-text where SQLite has FTS5) and, keyed by result-cache key,
+# reused to warm the result cache.
+class RecipeStore:
+    def __init__(self, path=STORE_PATH, max_batch=MAX_BATCH, commit_interval=COMMIT_INTERVAL):
+        self.path = path
+        self.max_batch = max_batch
+        self.commit_interval = commit_interval
+
+        db = sqlite3.connect(path)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS history ("
+                   "id INTEGER PRIMARY KEY, saved_at REAL NOT NULL, prompt TEXT NOT NULL, "
+                   "recipe TEXT NOT NULL, parsed TEXT, model_version TEXT, cache_key TEXT)")
+        db.execute("CREATE INDEX IF NOT EXISTS history_cache_key ON history (cache_key, id)")
+        try:
+            db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS history_fts USING fts5(prompt, recipe)")
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False  # SQLite built without FTS5: search with LIKE
+        db.commit()
+        db.close()
+
+        self._reader = sqlite3.connect(path, check_same_thread=False)
+        self._read_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._writer = threading.Thread(target=self._run, name="recipe-store", daemon=True)
+        self._writer.start()
+
+    # Queue a generated recipe for saving; the Future resolves to its id once committed
+    def save(self, prompt, recipe, model_version=None, cache_key=None):
+        parsed = parse_recipe(recipe)
+        record = _Record((time.time(), prompt, recipe, parsed.to_json() if parsed is not None else None,
+                          model_version, cache_key))
+        self._queue.put(record)
+        return record.future
+
+    def _run(self):
+        db = sqlite3.connect(self.path)
+        while True:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.perf_counter() + self.commit_interval
+            stop = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    record = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is None:
+                    stop = True
+                    break
+                batch.append(record)
+            self._write(db, batch)
+            for _ in batch:
+                self._queue.task_done()
+            if stop:
+                break
+        db.close()
+        self._queue.task_done()  # the closing sentinel
+
+    def _write(self, db, batch):
+        try:
+            ids = []
+            with db:
+                for record in batch:
+                    cursor = db.execute("INSERT INTO history (saved_at, prompt, recipe, parsed, model_version, "
+                                        "cache_key) VALUES (?, ?, ?, ?, ?, ?)", record.values)
+                    ids.append(cursor.lastrowid)
+                if self.full_text:
+                    db.executemany("INSERT INTO history_fts (rowid, prompt, recipe) VALUES (?, ?, ?)",
+                                   [(i, r.values[1], r.values[2]) for i, r in zip(ids, batch)])
+        except Exception as e:
+            for record in batch:
+                record.future.set_exception(e)
+        else:
+            for record_id, record in zip(ids, batch):
+                record.future.set_result(record_id)
+
+    # Wait until everything queued so far is committed
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join()
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def _rows(self, sql, params=()):
+        with self._read_lock:
+            return [self._entry(row) for row in self._reader.execute(sql, params).fetchall()]
+
+    @staticmethod
+    def _entry(row):
+        entry = dict(zip(COLUMNS, row))
+        entry["parsed"] = Recipe.from_json(entry["parsed"]) if entry["parsed"] else None
+        return entry
+
+    _SELECT = "SELECT " + ", ".join("h." + c for c in COLUMNS) + " FROM history h"
+
+    def get(self, record_id):
+        rows = self._rows(self._SELECT + " WHERE h.id = ?", (record_id,))
+        return rows[0] if rows else None
+
+    def recent(self, limit=20):
+        return self._rows(self._SELECT + " ORDER BY h.id DESC LIMIT ?", (limit,))
+
+    # Latest saved recipe for a result-cache key
+    def lookup(self, cache_key):
+        rows = self._rows(self._SELECT + " WHERE h.cache_key = ? ORDER BY h.id DESC LIMIT 1", (cache_key,))
+        return rows[0]["recipe"] if rows else None
+
+    # Saved recipes whose prompt or text contains every word of `text`, newest first
+    def search(self, text, limit=20):
+        words = text.split()
+        if not words:
+            return self.recent(limit)
+        if self.full_text:
+            query = " ".join('"' + word.replace('"', '""') + '"' for word in words)
+            return self._rows(self._SELECT + " JOIN history_fts f ON f.rowid = h.id "
+                              "WHERE history_fts MATCH ? ORDER BY h.id DESC LIMIT ?", (query, limit))
+        where = " AND ".join(["(h.prompt LIKE ? OR h.recipe LIKE ?)"] * len(words))
+        params = [p for word in words for p in (f"%{word}%",) * 2]
+        return self._rows(self._SELECT + f" WHERE {where} ORDER BY h.id DESC LIMIT ?", (*params, limit))
+
+    # (cache key, recipe) pairs of the most recently saved recipes, for warming a RecipeCache
+    def cache_items(self, limit=1024):
+        with self._read_lock:
+            rows = self._reader.execute(
+                "SELECT cache_key, recipe FROM history WHERE id IN (SELECT MAX(id) FROM history "
+                "WHERE cache_key IS NOT NULL GROUP BY cache_key) ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+        return rows[::-1]  # oldest first, so the newest end up most recently used
+
+    def __len__(self):
+        with self._read_lock:
+            return self._reader.execute("SELECT COUNT(*) FROM history").fetchone()[0]
+
+
+# Open a store that is flushed and closed when the interpreter exits
+def open_store(path=STORE_PATH):
+    store = RecipeStore(path)
+    atexit.register(store.close)
+    return store
+
+
+def _print(entry, full=False):
+    saved = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["saved_at"]))
+    print(f"#{entry['id']}  {saved}  {entry['prompt']}")
+    if full:
+        recipe = entry["parsed"]
+        print(recipe.to_text() if recipe is not None else entry["recipe"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browse saved recipes")
+    parser.add_argument("command", choices=("recent", "search", "show"))
+    parser.add_argument("query", nargs="?", default="", help="search words, or the id to show")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--path", default=STORE_PATH)
+    args = parser.parse_args()
+
+    store = RecipeStore(args.path)
+    if args.command == "show":
+        entry = store.get(int(args.query))
+        if entry is None:
+            parser.error(f"no saved recipe #{args.query}")
+        _print(entry, full=True)
+    else:
+        entries = store.search(args.query, args.limit) if args.command == "search" else store.recent(args.limit)
+        for entry in entries:
+            _print(entry)
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
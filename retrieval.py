@@ -0,0 +1,288 @@
+import argparse
+import csv
+import hashlib
+import math
+import os
+import pickle
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+
+from text_utils import clean_text
+
+DATASET_PATH = './unique_prompts_generated_recipes_v2.csv'
+INDEX_PATH = './recipe_index.pkl'
+INDEX_VERSION = 1
+DEFAULT_THRESHOLD = 0.8
+MAX_INGREDIENT_WORDS = 3
+LATENCY_WINDOW = 10000  # latency samples kept per path for the percentiles
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def read_prompts(path=DATASET_PATH, limit=None):
+    prompts = []
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            prompts.append(row["Prompt"])
+            if limit and len(prompts) >= limit:
+                break
+    return prompts
+
+
+# Unigrams and bigrams of a cleaned prompt; bigrams keep some word order
+def terms(cleaned):
+    words = cleaned.split()
+    return words + [a + " " + b for a, b in zip(words, words[1:])]
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q / 100 * (len(values) - 1))))]
+
+
+# Per-path counts and the latencies of the most recent lookups (retrieval hits
+# vs model fallbacks), so a long-running server keeps a bounded window
+class PathStats:
+    def __init__(self, window=LATENCY_WINDOW):
+        self._lock = threading.Lock()
+        self.counts = {"retrieval": 0, "model": 0}
+        self.latencies = {"retrieval": deque(maxlen=window), "model": deque(maxlen=window)}
+
+    def record(self, path, seconds):
+        with self._lock:
+            self.counts[path] += 1
+            self.latencies[path].append(seconds)
+
+    def summary(self):
+        with self._lock:
+            counts = dict(self.counts)
+            latencies = {path: list(values) for path, values in self.latencies.items()}
+        hits = counts["retrieval"]
+        total = hits + counts["model"]
+        result = {"lookups": total, "hit_rate": hits / total if total else 0.0}
+        for path, values in latencies.items():
+            result[path] = {
+                "count": counts[path],
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            }
+        return result
+
+
+# Index over the bundled prompt -> recipe pairs. Prompts are grouped by the
+# ingredients they mention (in order), since those are what the recipe text is
+# made of; a prompt is answered from the dataset when a stored prompt with the
+# same ingredients reaches the TF-IDF cosine similarity threshold. Lookups only
+# score that small group, so a hit costs microseconds.
+class RecipeIndex:
+    def __init__(self, recipes, vectors, groups, idf, vocabulary, threshold=DEFAULT_THRESHOLD):
+        self.recipes = recipes        # doc id -> cleaned recipe
+        self.vectors = vectors        # doc id -> {term: normalized tf-idf weight}
+        self.groups = groups          # ingredient tuple -> [doc id]
+        self.idf = idf
+        self.vocabulary = vocabulary  # known ingredient names (1-3 words)
+        self.threshold = threshold
+        self.unseen_idf = math.log(len(recipes) or 1) + 1.0
+        self.stats = PathStats()
+
+    @classmethod
+    def build(cls, path=DATASET_PATH, threshold=DEFAULT_THRESHOLD):
+        prompts, recipes, vocabulary = [], [], set()
+        with open(path, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                prompts.append(clean_text(row["Prompt"]))
+                recipe = row["Generated Recipe"]
+                recipes.append(clean_text(recipe))
+                # "Dish: Ingredients: a, b, c. Instructions: ..." -> {a, b, c}
+                lower = recipe.lower()
+                if "ingredients:" in lower:
+                    listed = lower.split("ingredients:", 1)[1].split("instructions:", 1)[0]
+                    for name in listed.split(","):
+                        name = clean_text(name).strip()
+                        if name and len(name.split()) <= MAX_INGREDIENT_WORDS:
+                            vocabulary.add(name)
+
+        counts = [Counter(terms(p)) for p in prompts]
+        df = Counter(term for c in counts for term in c)
+        idf = {term: math.log(len(prompts) / n) + 1.0 for term, n in df.items()}
+
+        index = cls(recipes, [], {}, idf, frozenset(vocabulary), threshold)
+        for doc, (prompt, c) in enumerate(zip(prompts, counts)):
+            index.vectors.append(index._vector(c))
+            index.groups.setdefault(index.find_ingredients(prompt), []).append(doc)
+        return index
+
+    # Load the persisted index, rebuilding it if the dataset changed
+    @classmethod
+    def load_or_build(cls, path=DATASET_PATH, index_path=INDEX_PATH, threshold=DEFAULT_THRESHOLD):
+        dataset = file_hash(path)
+        if index_path and os.path.exists(index_path):
+            try:
+                with open(index_path, "rb") as f:
+                    saved = pickle.load(f)
+                if saved.get("version") == INDEX_VERSION and saved.get("dataset") == dataset:
+                    return cls(saved["recipes"], saved["vectors"], saved["groups"],
+                               saved["idf"], saved["vocabulary"], threshold)
+            except (OSError, pickle.UnpicklingError, EOFError, KeyError):
+                pass
+
+        index = cls.build(path, threshold)
+        if index_path:
+            try:
+                index.save(index_path, dataset)
+            except OSError as e:
+                # e.g. a read-only working directory: the index still works, it is just rebuilt next time
+                print(f"could not save the retrieval index to {index_path} ({e})", file=sys.stderr)
+        return index
+
+    def save(self, index_path, dataset):
+        saved = {
+            "version": INDEX_VERSION,
+            "dataset": dataset,
+            "recipes": self.recipes,
+            "vectors": self.vectors,
+            "groups": self.groups,
+            "idf": self.idf,
+            "vocabulary": self.vocabulary,
+        }
+        tmp = index_path + ".tmp"
+        try:
+            with open(tmp, "wb") as f:
+                pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, index_path)
+        except OSError:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    # Normalized tf-idf weights; terms never seen in the dataset get the highest idf
+    def _vector(self, counts):
+        weights = {term: tf * self.idf.get(term, self.unseen_idf) for term, tf in counts.items()}
+        norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+        return {term: w / norm for term, w in weights.items()}
+
+    # Ingredient names mentioned in a cleaned prompt, longest match first
+    def find_ingredients(self, cleaned):
+        words = cleaned.split()
+        found = []
+        i = 0
+        while i < len(words):
+            for size in range(min(MAX_INGREDIENT_WORDS, len(words) - i), 0, -1):
+                name = " ".join(words[i:i + size])
+                if name in self.vocabulary:
+                    found.append(name)
+                    i += size
+                    break
+            else:
+                i += 1
+        return tuple(found)
+
+    # Best matching doc id and its cosine similarity for a cleaned prompt
+    def search(self, cleaned):
+        group = self.groups.get(self.find_ingredients(cleaned))
+        if not group:
+            return None, 0.0
+        query = self._vector(Counter(terms(cleaned)))
+        best, best_score = None, 0.0
+        for doc in group:
+            vector = self.vectors[doc]
+            score = sum(w * vector.get(term, 0.0) for term, w in query.items())
+            if score > best_score:
+                best, best_score = doc, score
+        return best, best_score
+
+    # Stored recipe for a cleaned prompt, or None when the model must generate one
+    def lookup(self, cleaned):
+        doc, score = self.search(cleaned)
+        if doc is None or score < self.threshold:
+            return None
+        return self.recipes[doc]
+
+
+# Replay prompts through the index and report the hit rate and latency of both
+# paths. Without a model only the lookup itself is timed.
+def report(index, prompts, model=None, tokenizer=None):
+    import json
+
+    if model is not None:
+        import recipe_model
+        recipe_model.configure_cache(0)
+        recipe_model.retrieval_index = index
+        for prompt in prompts:
+            recipe_model.generate_recipe(prompt, model, tokenizer)
+        print(json.dumps(index.stats.summary(), indent=2))
+        return
+
+    hits, lookups = 0, []
+    for prompt in prompts:
+        start = time.perf_counter()
+        hits += index.lookup(clean_text(prompt)) is not None
+        lookups.append(time.perf_counter() - start)
+    print(json.dumps({
+        "lookups": len(prompts),
+        "hit_rate": hits / len(prompts) if prompts else 0.0,
+        "lookup": {f"p{q}_ms": percentile(lookups, q) * 1000 for q in (50, 95, 99)},
+    }, indent=2))
+
+
+# Variations of the dataset prompts: some keep the ingredients, some swap one
+def perturbed_prompts(path=DATASET_PATH, limit=500, seed=42):
+    rng = random.Random(seed)
+    prompts = read_prompts(path)
+    rng.shuffle(prompts)
+    diets = ["vegetarian", "vegan", "dairy-free", "gluten-free"]
+    meals = ["breakfast", "lunch", "dinner"]
+    result = []
+    for prompt in prompts[:limit]:
+        choice = rng.random()
+        if choice < 0.4:
+            for diet in diets:
+                if diet in prompt:
+                    prompt = prompt.replace(diet, rng.choice(diets), 1)
+                    break
+        elif choice < 0.7:
+            for meal in meals:
+                if meal in prompt:
+                    prompt = prompt.replace(meal, rng.choice(meals), 1)
+                    break
+        else:
+            prompt = prompt.replace(" with ", " with saffron, ", 1)
+        result.append(prompt)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the retrieval index and report its hit rate")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--index", default=INDEX_PATH)
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    parser.add_argument("--limit", type=int, default=500, help="prompts to replay")
+    parser.add_argument("--with-model", action="store_true",
+                        help="run misses through the model to time the fallback path")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = RecipeIndex.load_or_build(args.dataset, args.index, args.threshold)
+    print(f"index ready in {time.perf_counter() - start:.3f}s ({len(index.recipes)} recipes)")
+
+    model = tokenizer = None
+    if args.with_model:
+        import recipe_model
+        model, tokenizer = recipe_model.load_model()
+    report(index, perturbed_prompts(args.dataset, args.limit), model, tokenizer)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,378 @@
+import argparse
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import backends
+import encoder_cache
+import recipe_model
+import retrieval
+import speculative
+import tracing
+from batching import engine_for
+from candidates import CANDIDATE_METHODS, DEFAULT_CANDIDATES
+from decoding import DECODING_MODES
+from recipe_parser import parse_recipe
+
+MAX_BODY_SIZE = 1 << 20
+MAX_BATCH_PROMPTS = 256
+MAX_CANDIDATES = 16
+
+
+# A generated recipe with its parsed structure ("parsed" is null when the
+# output has no sections)
+def recipe_payload(prompt, recipe):
+    parsed = parse_recipe(recipe)
+    return {"prompt": prompt, "recipe": recipe, "parsed": parsed.to_dict() if parsed is not None else None}
+
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    413: "Payload Too Large",
+    429: "Too Many Requests",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+# Returned by handlers that stream NDJSON objects with chunked transfer encoding
+class StreamingResponse:
+    def __init__(self, items, on_close):
+        self.items = items
+        self.on_close = on_close
+
+
+class TextResponse:
+    def __init__(self, text, content_type="text/plain; charset=utf-8"):
+        self.text = text
+        self.content_type = content_type
+
+
+# Headless recipe server: a small asyncio HTTP/1.1 front end that hands
+# generation off to a thread pool so the event loop never blocks on
+# model.generate. Requests beyond max_queue in flight get a 429. The pool has
+# a thread per in-flight request (most of them just wait on the batching
+# engine), so concurrent prompts are limited only by max_queue and batched
+# up to the engine's max_batch_size.
+class RecipeServer:
+    def __init__(self, model, tokenizer, max_queue=64, max_length=150, decoding="greedy"):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.max_queue = max_queue
+        self.max_length = max_length
+        self.decoding = decoding
+        self.executor = ThreadPoolExecutor(max_workers=max_queue, thread_name_prefix="generate")
+        self.in_flight = 0
+        self.rejected = 0
+        self.served = 0
+        self.routes = {
+            ("POST", "/generate"): self.handle_generate,
+            ("POST", "/generate/batch"): self.handle_batch,
+            ("POST", "/generate/stream"): self.handle_stream,
+            ("POST", "/generate/candidates"): self.handle_candidates,
+            ("GET", "/healthz"): self.handle_health,
+            ("GET", "/metrics"): self.handle_metrics,
+        }
+
+    def _acquire(self):
+        if self.in_flight >= self.max_queue:
+            self.rejected += 1
+            raise HTTPError(429, "server busy, retry later")
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self.served += 1
+
+    # Run a blocking generation call on the worker pool, enforcing the queue limit
+    async def run_generation(self, func, *args):
+        self._acquire()
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self._release()
+        return result
+
+    def _max_length(self, body):
+        max_length = body.get("max_length", self.max_length)
+        if not isinstance(max_length, int) or isinstance(max_length, bool) or not 1 <= max_length <= 512:
+            raise HTTPError(400, "max_length must be an integer between 1 and 512")
+        return max_length
+
+    def _decoding(self, body):
+        decoding = body.get("decoding", self.decoding)
+        if decoding not in DECODING_MODES:
+            raise HTTPError(400, f"decoding must be one of {', '.join(DECODING_MODES)}")
+        return decoding
+
+    async def handle_generate(self, body):
+        prompt = body.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPError(400, "'prompt' must be a non-empty string")
+        recipe = await self.run_generation(recipe_model.generate_recipe, prompt, self.model, self.tokenizer,
+                                           self._max_length(body), self._decoding(body))
+        return recipe_payload(prompt, recipe)
+
+    async def handle_batch(self, body):
+        prompts = body.get("prompts")
+        if not isinstance(prompts, list) or not prompts or not all(isinstance(p, str) for p in prompts):
+            raise HTTPError(400, "'prompts' must be a non-empty list of strings")
+        if len(prompts) > MAX_BATCH_PROMPTS:
+            raise HTTPError(413, f"at most {MAX_BATCH_PROMPTS} prompts per batch")
+        recipes = await self.run_generation(recipe_model.generate_recipes, prompts, self.model, self.tokenizer,
+                                            self._max_length(body), self._decoding(body))
+        return {"recipes": [recipe_payload(p, r) for p, r in zip(prompts, recipes)]}
+
+    async def handle_candidates(self, body):
+        prompt = body.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPError(400, "'prompt' must be a non-empty string")
+        n = body.get("n", DEFAULT_CANDIDATES)
+        if not isinstance(n, int) or isinstance(n, bool) or not 1 <= n <= MAX_CANDIDATES:
+            raise HTTPError(400, f"'n' must be an integer between 1 and {MAX_CANDIDATES}")
+        method = body.get("method", "sample")
+        if method not in CANDIDATE_METHODS:
+            raise HTTPError(400, f"'method' must be one of {', '.join(CANDIDATE_METHODS)}")
+        recipes = await self.run_generation(recipe_model.generate_candidates, prompt, self.model, self.tokenizer,
+                                            n, self._max_length(body), method)
+        return {"prompt": prompt, "candidates": [recipe_payload(prompt, r) for r in recipes]}
+
+    async def handle_stream(self, body):
+        prompt = body.get("prompt")
+        if not isinstance(prompt, str) or not prompt.strip():
+            raise HTTPError(400, "'prompt' must be a non-empty string")
+        max_length = self._max_length(body)
+        decoding = self._decoding(body)
+        self._acquire()
+        return StreamingResponse(self._stream_pieces(prompt, max_length, decoding), self._release)
+
+    # Drive the blocking stream_recipe generator on the worker pool and relay its
+    # pieces. If the client goes away the generator is closed, which stops the
+    # producer (and with it model.generate) before the in-flight slot is released.
+    async def _stream_pieces(self, prompt, max_length, decoding):
+        loop = asyncio.get_running_loop()
+        pieces = asyncio.Queue()
+        stop = threading.Event()
+
+        def produce():
+            stream = recipe_model.stream_recipe(prompt, self.model, self.tokenizer, max_length, decoding)
+            try:
+                for piece in stream:
+                    if stop.is_set():
+                        return
+                    loop.call_soon_threadsafe(pieces.put_nowait, ("piece", piece))
+            except Exception as e:
+                loop.call_soon_threadsafe(pieces.put_nowait, ("error", str(e)))
+            else:
+                loop.call_soon_threadsafe(pieces.put_nowait, ("done", None))
+            finally:
+                stream.close()
+
+        producer = loop.run_in_executor(self.executor, produce)
+        try:
+            recipe = []
+            while True:
+                kind, value = await pieces.get()
+                if kind == "piece":
+                    recipe.append(value)
+                    yield {"text": value}
+                elif kind == "error":
+                    yield {"error": value}
+                    break
+                else:
+                    yield {"done": True, **recipe_payload(prompt, "".join(recipe))}
+                    break
+        finally:
+            stop.set()
+            await producer
+
+    async def handle_health(self, body):
+        return {
+            "status": "ok",
+            "device": str(self.model.device),
+            "backend": getattr(self.model, "backend_name", "torch"),
+            "in_flight": self.in_flight,
+            "max_queue": self.max_queue,
+            "served": self.served,
+            "rejected": self.rejected,
+            "cache": recipe_model.cache.stats() if recipe_model.cache is not None else None,
+            "retrieval": (recipe_model.retrieval_index.stats.summary()
+                          if recipe_model.retrieval_index is not None else None),
+            "speculative": speculative.stats.summary() if speculative.stats.requests else None,
+            "encoder_cache": encoder_cache.active.stats() if encoder_cache.active is not None else None,
+        }
+
+    # Prometheus text format; per-request metrics need tracing enabled (--tracing)
+    async def handle_metrics(self, body):
+        return TextResponse(tracing.render({
+            "dishcrafter_in_flight": ("gauge", "Requests currently being served", self.in_flight),
+            "dishcrafter_served_total": ("counter", "Requests served since startup", self.served),
+            "dishcrafter_rejected_total": ("counter", "Requests rejected with 429", self.rejected),
+        }), "text/plain; version=0.0.4; charset=utf-8")
+
+    async def dispatch(self, method, path, body):
+        handler = self.routes.get((method, path))
+        if handler is None:
+            if any(p == path for _, p in self.routes):
+                raise HTTPError(405, "method not allowed")
+            raise HTTPError(404, "not found")
+        if body:
+            try:
+                body = json.loads(body)
+            except ValueError:
+                raise HTTPError(400, "request body must be JSON")
+            if not isinstance(body, dict):
+                raise HTTPError(400, "request body must be a JSON object")
+        else:
+            body = {}
+        return await handler(body)
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "malformed request line"}, False)
+                    break
+
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+                try:
+                    length = int(headers.get("content-length", 0))
+                    if length < 0:
+                        raise ValueError(length)
+                except ValueError:
+                    await self.respond(writer, 400, {"error": "invalid content-length"}, False)
+                    break
+                try:
+                    if length > MAX_BODY_SIZE:
+                        raise HTTPError(413, "request body too large")
+                    body = await reader.readexactly(length) if length else b""
+                    status, payload = 200, await self.dispatch(method, path.split("?")[0], body)
+                except HTTPError as e:
+                    status, payload = e.status, {"error": e.message}
+                    if e.status == 413:
+                        keep_alive = False
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+
+                if isinstance(payload, StreamingResponse):
+                    await self.respond_stream(writer, payload, keep_alive)
+                else:
+                    await self.respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def respond(self, writer, status, payload, keep_alive):
+        if isinstance(payload, TextResponse):
+            data, content_type = payload.text.encode("utf-8"), payload.content_type
+        else:
+            data, content_type = json.dumps(payload).encode("utf-8"), "application/json"
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n")
+        if status == 429:
+            head += "Retry-After: 1\r\n"
+        writer.write(head.encode("latin-1") + b"\r\n" + data)
+        await writer.drain()
+
+    async def respond_stream(self, writer, response, keep_alive):
+        try:
+            head = ("HTTP/1.1 200 OK\r\n"
+                    "Content-Type: application/x-ndjson\r\n"
+                    "Transfer-Encoding: chunked\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+            writer.write(head.encode("latin-1"))
+            async for item in response.items:
+                data = json.dumps(item).encode("utf-8") + b"\n"
+                writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                await writer.drain()
+            writer.write(b"0\r\n\r\n")
+            await writer.drain()
+        finally:
+            # Waits for the producer to stop, so the slot covers all the work still running
+            await response.items.aclose()
+            response.on_close()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"DishCrafter server listening on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless DishCrafter recipe server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--model-path", default=recipe_model.MODEL_PATH)
+    parser.add_argument("--backend", choices=backends.BACKENDS, default=recipe_model.BACKEND)
+    parser.add_argument("--max-queue", type=int, default=64,
+                        help="requests allowed in flight before answering 429")
+    parser.add_argument("--max-batch-size", type=int, default=16)
+    parser.add_argument("--max-wait", type=float, default=0.01,
+                        help="seconds the batching engine waits to fill a batch")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="in-memory result cache entries (0 disables caching)")
+    parser.add_argument("--cache-ttl", type=float, default=None, help="seconds before a cached recipe expires")
+    parser.add_argument("--cache-db", default=None, help="SQLite file for a persistent cache tier")
+    parser.add_argument("--decoding", choices=DECODING_MODES, default="greedy",
+                        help="default decoding mode; requests may override it with \"decoding\"")
+    parser.add_argument("--retrieval-threshold", type=float, default=retrieval.DEFAULT_THRESHOLD,
+                        help="similarity needed to answer from the bundled dataset (0 disables)")
+    parser.add_argument("--encoder-cache-mb", type=float, default=encoder_cache.DEFAULT_MAX_BYTES / (1 << 20),
+                        help="memory for cached encoder outputs of repeated prompts (0 disables)")
+    parser.add_argument("--tracing", action="store_true",
+                        help="record per-stage timings and token counts for /metrics")
+    parser.add_argument("--profile-rate", type=float, default=0.0,
+                        help="fraction of traced requests to run under the torch profiler")
+    parser.add_argument("--profile-dir", default=tracing.PROFILE_DIR)
+    args = parser.parse_args()
+
+    if args.tracing or args.profile_rate:
+        tracing.configure(True, args.profile_rate, args.profile_dir)
+
+    recipe_model.configure_cache(args.cache_size, args.cache_ttl, args.cache_db)
+    recipe_model.configure_retrieval(args.retrieval_threshold)
+    encoder_cache.configure(int(args.encoder_cache_mb * (1 << 20)))
+    model, tokenizer = recipe_model.load_model(args.model_path, backend=args.backend)
+    engine_for(model, tokenizer, model.device,
+               max_batch_size=args.max_batch_size, max_wait=args.max_wait)
+
+    server = RecipeServer(model, tokenizer, max_queue=args.max_queue, decoding=args.decoding)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import threading
+import time
+from collections import Counter, defaultdict
+
+import torch
+
+import encoder_cache
+from retrieval import DATASET_PATH, percentile
+from text_utils import clean_text
+
+MAX_INPUT_LENGTH = 128
+DRAFT_TOKENS = 8  # tokens drafted per verification step
+NGRAM_ORDER = 3
+
+
+# Guesses the next decoder tokens without running the model. Recipes are very
+# templated, so the continuation is usually either copied from the prompt
+# (ingredient names) or the most common continuation in the dataset recipes
+# ("... cook thoroughly and serve hot").
+class NGramDrafter:
+    def __init__(self, table, order=NGRAM_ORDER):
+        self.table = table
+        self.order = order
+
+    # Most common next token for every context of 1..order tokens in the
+    # tokenized dataset recipes (each preceded by the decoder start token)
+    @classmethod
+    def build(cls, sequences, start_id, order=NGRAM_ORDER):
+        counts = defaultdict(Counter)
+        for ids in sequences:
+            seq = [start_id, *ids]
+            for n in range(1, order + 1):
+                for i in range(n, len(seq)):
+                    counts[tuple(seq[i - n:i])][seq[i]] += 1
+        return cls({context: c.most_common(1)[0][0] for context, c in counts.items()}, order)
+
+    # Next token after `tokens`: the longest context wins, and a match in the
+    # prompt beats the dataset table for the same context length
+    def _next(self, tokens, prompt_ids):
+        for n in range(min(self.order, len(tokens)), 0, -1):
+            context = tokens[-n:]
+            for i in range(len(prompt_ids) - n - 1, -1, -1):
+                if prompt_ids[i:i + n] == context:
+                    return prompt_ids[i + n]
+            token = self.table.get(tuple(context))
+            if token is not None:
+                return token
+        return None
+
+    def draft(self, tokens, prompt_ids, count, eos_id):
+        tokens = list(tokens)
+        drafted = []
+        while len(drafted) < count:
+            token = self._next(tokens, prompt_ids)
+            if token is None:
+                break
+            drafted.append(token)
+            tokens.append(token)
+            if token == eos_id:
+                break
+        return drafted
+
+
+_drafters = {}
+_drafters_lock = threading.Lock()
+
+
+# One drafter per tokenizer, built from the pre-tokenized dataset cache
+def drafter_for(tokenizer, start_id, dataset=DATASET_PATH):
+    key = (id(tokenizer), start_id)
+    with _drafters_lock:
+        drafter = _drafters.get(key)
+        if drafter is None:
+            from dataset_cache import open_cache
+            try:
+                cache = open_cache(dataset, tokenizer)
+            except OSError:
+                drafter = NGramDrafter({})  # prompt lookup only
+            else:
+                drafter = NGramDrafter.build((list(cache[i][1]) for i in range(len(cache))), start_id)
+                cache.close()
+            _drafters[key] = drafter
+        return drafter
+
+
+# Accepted draft tokens per verification step and per-request latency
+class SpeculativeStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.steps = 0
+        self.drafted = 0
+        self.accepted = 0
+        self.tokens = 0
+        self.latencies = []
+
+    def record(self, steps, drafted, accepted, tokens, seconds):
+        with self._lock:
+            self.requests += 1
+            self.steps += steps
+            self.drafted += drafted
+            self.accepted += accepted
+            self.tokens += tokens
+            self.latencies.append(seconds)
+            if len(self.latencies) > 10000:
+                del self.latencies[:5000]
+
+    def summary(self):
+        with self._lock:
+            latencies = sorted(self.latencies)
+            return {
+                "requests": self.requests,
+                "tokens_per_step": self.tokens / self.steps if self.steps else 0.0,
+                "accepted_per_step": self.accepted / self.steps if self.steps else 0.0,
+                "acceptance_rate": self.accepted / self.drafted if self.drafted else 0.0,
+                "p50_ms": percentile(latencies, 50) * 1000 if latencies else None,
+                "p95_ms": percentile(latencies, 95) * 1000 if latencies else None,
+            }
+
+
+stats = SpeculativeStats()
+
+
+# ONNX Runtime models don't take a cropped KV cache, so they decode greedily
+def supported(model):
+    return getattr(model, "backend_name", "torch") != "onnx"
+
+
+# Drop cached keys/values past `length` decoder positions (rejected drafts)
+def _crop(past, length):
+    if hasattr(past, "crop"):
+        past.crop(length)
+        return past
+    return tuple((layer[0][:, :, :length], layer[1][:, :, :length]) + tuple(layer[2:]) for layer in past)
+
+
+# Greedy decoding of one cleaned prompt, drafting tokens with the n-gram
+# drafter and checking all of them with a single decoder forward pass. A draft
+# token is kept only if it is the decoder's argmax at its position, and the
+# first mismatch is replaced by the argmax, so the output is what greedy
+# decoding produces. Pieces are passed to `streamer` as they are accepted.
+def generate(model, tokenizer, prompt, max_length=150, draft_tokens=DRAFT_TOKENS, streamer=None):
+    begin = time.perf_counter()
+    config = model.config
+    start_id = config.decoder_start_token_id
+    eos_id = config.eos_token_id
+    drafter = drafter_for(tokenizer, start_id)
+
+    inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_INPUT_LENGTH)
+    input_ids = inputs["input_ids"].to(model.device)
+    attention_mask = inputs["attention_mask"].to(model.device)
+    prompt_ids = inputs["input_ids"][0].tolist()
+    if prompt_ids and prompt_ids[-1] == eos_id:
+        prompt_ids.pop()  # the prompt's own eos says nothing about the recipe's
+
+    tokens = [start_id]
+    cached = 0  # decoder positions already in the KV cache
+    past = None
+    steps = drafted = accepted = 0
+    if streamer is not None:
+        streamer.put(torch.tensor(tokens))  # the start token, like model.generate
+    with torch.inference_mode():
+        encoder_outputs = encoder_cache.encode(model, input_ids, attention_mask)
+        while len(tokens) < max_length and tokens[-1] != eos_id:
+            draft = drafter.draft(tokens, prompt_ids, min(draft_tokens, max_length - len(tokens) - 1), eos_id)
+            feed = tokens[cached:] + draft
+            outputs = model(encoder_outputs=encoder_outputs, attention_mask=attention_mask,
+                            decoder_input_ids=torch.tensor([feed], device=model.device),
+                            past_key_values=past, use_cache=True)
+            predicted = outputs.logits[0, len(feed) - len(draft) - 1:].argmax(-1).tolist()
+
+            n = 0
+            while n < len(draft) and draft[n] == predicted[n] and draft[n] != eos_id:
+                n += 1
+            if n < len(draft) and draft[n] == predicted[n]:
+                new = draft[:n + 1]  # accepted up to and including eos
+                n += 1
+            else:
+                new = draft[:n] + [predicted[n]]
+            tokens += new
+            cached = len(tokens) - 1
+            past = _crop(outputs.past_key_values, cached)
+
+            steps += 1
+            drafted += len(draft)
+            accepted += n
+            if streamer is not None:
+                streamer.put(torch.tensor(new))
+
+    if streamer is not None:
+        streamer.end()
+    stats.record(steps, drafted, accepted, len(tokens) - 1, time.perf_counter() - begin)
+    return tokenizer.decode(tokens, skip_special_tokens=True)
+
+
+# Greedy model.generate vs speculative decoding over the bundled prompts
+def measure(model, tokenizer, prompts, max_length=150, draft_tokens=DRAFT_TOKENS):
+    greedy_times, speculative_times, same = [], [], 0
+    for prompt in prompts:
+        cleaned = clean_text(prompt)
+        inputs = tokenizer(cleaned, return_tensors="pt", truncation=True, max_length=MAX_INPUT_LENGTH).to(model.device)
+        start = time.perf_counter()
+        with torch.inference_mode():
+            output = model.generate(**inputs, max_length=max_length)
+        greedy_times.append(time.perf_counter() - start)
+        greedy = tokenizer.decode(output[0], skip_special_tokens=True)
+
+        start = time.perf_counter()
+        recipe = generate(model, tokenizer, cleaned, max_length, draft_tokens)
+        speculative_times.append(time.perf_counter() - start)
+        same += recipe == greedy
+
+    summary = stats.summary()
+    greedy_times.sort()
+    speculative_times.sort()
+    print(f"{len(prompts)} prompts, {same / len(prompts):.1%} identical to greedy")
+    print(f"tokens per step {summary['tokens_per_step']:.2f}, accepted drafts per step "
+          f"{summary['accepted_per_step']:.2f}, acceptance rate {summary['acceptance_rate']:.1%}")
+    for name, times in (("greedy", greedy_times), ("speculative", speculative_times)):
+        print(f"{name:<12} p50 {percentile(times, 50) * 1000:7.1f} ms   p95 {percentile(times, 95) * 1000:7.1f} ms")
+
+
+def main():
+    import recipe_model
+    from retrieval import read_prompts
+
+    parser = argparse.ArgumentParser(description="Compare speculative and greedy decoding on the bundled prompts")
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--max-length", type=int, default=150)
+    parser.add_argument("--draft-tokens", type=int, default=DRAFT_TOKENS)
+    parser.add_argument("--backend", default=None)
+    args = parser.parse_args()
+
+    model, tokenizer = recipe_model.load_model(backend=args.backend)
+    if not supported(model):
+        parser.error("speculative decoding needs the torch or int8 backend")
+    measure(model, tokenizer, read_prompts(limit=args.limit), args.max_length, args.draft_tokens)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+import json
+import os
+import sys
+import time
+
+# Set to a file path to append one JSON line per app start, for tracking regressions
+LOG_ENV = "DISHCRAFTER_STARTUP_LOG"
+
+
+# Records named startup milestones as seconds since the timer was created
+class StartupTimer:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.marks = {}
+
+    def mark(self, name):
+        # Only the first occurrence of a milestone counts
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.start
+        return self.marks[name]
+
+    def report(self, stream=sys.stdout):
+        parts = [f"{name} {elapsed:.3f}s" for name, elapsed in self.marks.items()]
+        print("startup: " + " | ".join(parts), file=stream)
+
+        path = os.environ.get(LOG_ENV)
+        if path:
+            with open(path, "a") as f:
+                f.write(json.dumps({"time": time.time(), "marks": self.marks}) + "\n")
@@ -0,0 +1,20 @@
+import re
+
+# Bump when clean_text's output changes, so pre-tokenized caches are rebuilt
+CLEANING_VERSION = 1
+
+_STRIP_PATTERN = re.compile(r'[^a-zA-Z0-9\s]')
+
+# Every ASCII character the pattern strips, derived from the pattern itself so
+# the fast path can't drift from it
+_STRIP_ASCII = bytes(c for c in range(128) if _STRIP_PATTERN.match(chr(c)))
+
+# Clean Text
+def clean_text(text):
+    if text.isascii():
+        # Byte-level translate is several times faster than re.sub
+        return text.encode('ascii').lower().translate(None, _STRIP_ASCII).decode('ascii')
+    return _STRIP_PATTERN.sub('', text.lower())
+
+def clean_texts(texts):
+    return [clean_text(text) for text in texts]
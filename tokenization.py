@@ -0,0 +1,96 @@
+import argparse
+import re
+import sys
+import time
+
+from retrieval import DATASET_PATH, read_prompts
+from text_utils import clean_text, clean_texts
+
+MAX_INPUT_LENGTH = 128
+
+
+# Rust-backed T5TokenizerFast when it can be built for the checkpoint, the
+# SentencePiece T5Tokenizer otherwise
+def load_tokenizer(path, fast=True):
+    from transformers import T5Tokenizer, T5TokenizerFast
+
+    if fast:
+        try:
+            return T5TokenizerFast.from_pretrained(path)
+        except (OSError, ValueError, ImportError) as e:
+            print(f"fast tokenizer unavailable ({e}), using T5Tokenizer", file=sys.stderr)
+    return T5Tokenizer.from_pretrained(path)
+
+
+# Clean and tokenize a list of prompts in one call, padded to the longest
+def encode_prompts(tokenizer, prompts, return_tensors="pt"):
+    return tokenizer(clean_texts(prompts), return_tensors=return_tensors, padding=True,
+                     truncation=True, max_length=MAX_INPUT_LENGTH)
+
+
+# Fast and slow tokenizers must produce identical ids for every cleaned prompt
+def check_parity(path, prompts):
+    from transformers import T5Tokenizer, T5TokenizerFast
+
+    slow = T5Tokenizer.from_pretrained(path)
+    fast = T5TokenizerFast.from_pretrained(path)
+    cleaned = clean_texts(prompts)
+    slow_ids = [slow(p, truncation=True, max_length=MAX_INPUT_LENGTH)["input_ids"] for p in cleaned]
+    fast_ids = fast(cleaned, truncation=True, max_length=MAX_INPUT_LENGTH)["input_ids"]
+    mismatches = [(p, a, b) for p, a, b in zip(cleaned, slow_ids, fast_ids) if a != b]
+    for prompt, a, b in mismatches[:5]:
+        print(f"mismatch for {prompt!r}:\n  slow {a}\n  fast {b}", file=sys.stderr)
+    print(f"parity: {len(prompts) - len(mismatches)}/{len(prompts)} prompts identical")
+    return not mismatches
+
+
+# Per-prompt preprocessing cost: regex cleaning + SentencePiece one prompt at a
+# time (the old request path) vs translate cleaning + fast batch encoding
+def benchmark(path, prompts, batch_size=32):
+    from transformers import T5Tokenizer
+
+    def regex_clean(text):
+        text = text.lower()
+        return re.sub(r'[^a-zA-Z0-9\s]', '', text)
+
+    slow = T5Tokenizer.from_pretrained(path)
+    fast = load_tokenizer(path)
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        slow(regex_clean(prompt), return_tensors="pt", padding=True, truncation=True, max_length=MAX_INPUT_LENGTH)
+    before = (time.perf_counter() - start) / len(prompts)
+
+    start = time.perf_counter()
+    for prompt in prompts:
+        clean_text(prompt)
+    cleaning = (time.perf_counter() - start) / len(prompts)
+
+    start = time.perf_counter()
+    for i in range(0, len(prompts), batch_size):
+        encode_prompts(fast, prompts[i:i + batch_size])
+    after = (time.perf_counter() - start) / len(prompts)
+
+    print(f"before (regex + T5Tokenizer, one at a time): {before * 1e6:9.1f} us/prompt")
+    print(f"after  (translate + {type(fast).__name__}, batch {batch_size}): {after * 1e6:9.1f} us/prompt "
+          f"({before / after:.1f}x, of which cleaning {cleaning * 1e6:.1f} us)")
+
+
+def main():
+    import recipe_model
+
+    parser = argparse.ArgumentParser(description="Tokenizer parity check and preprocessing micro-benchmark")
+    parser.add_argument("command", choices=("parity", "benchmark"))
+    parser.add_argument("--model-path", default=recipe_model.MODEL_PATH)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    prompts = read_prompts(args.dataset)
+    if args.command == "parity":
+        sys.exit(0 if check_parity(args.model_path, prompts) else 1)
+    benchmark(args.model_path, prompts, args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import argparse
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256)
+PROFILE_DIR = './profiles'
+
+
+class Counter:
+    def __init__(self, name, description, label=None):
+        self.name = name
+        self.description = description
+        self.label = label
+        self.values = {}
+
+    def inc(self, amount=1, label=None):
+        self.values[label] = self.values.get(label, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        for label, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            lines.append(f"{self.name}{_labels(self.label, label)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, description, buckets, label=None):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.label = label
+        self.series = {}  # label -> [bucket counts..., sum, count]
+
+    def observe(self, value, label=None):
+        series = self.series.get(label)
+        if series is None:
+            series = self.series[label] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        for label, series in sorted(self.series.items(), key=lambda item: str(item[0])):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_labels(self.label, label, le=bound)} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.label, label, le='+Inf')} {series[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.label, label)} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{_labels(self.label, label)} {series[-1]}")
+        return lines
+
+
+def _labels(name, value, le=None):
+    pairs = []
+    if name is not None and value is not None:
+        pairs.append(f'{name}="{value}"')
+    if le is not None:
+        pairs.append(f'le="{le}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+requests = Counter("dishcrafter_requests_total", "Prompts answered, by path (cache, retrieval, model, bulk)", "path")
+request_seconds = Histogram("dishcrafter_request_seconds", "End-to-end generation latency", LATENCY_BUCKETS)
+stage_seconds = Histogram("dishcrafter_stage_seconds", "Time spent per generation stage", LATENCY_BUCKETS, "stage")
+queue_wait_seconds = Histogram("dishcrafter_queue_wait_seconds", "Time waiting for a batch slot", LATENCY_BUCKETS)
+input_tokens = Counter("dishcrafter_input_tokens_total", "Prompt tokens fed to the encoder")
+output_tokens = Counter("dishcrafter_output_tokens_total", "Recipe tokens produced by the decoder")
+output_length = Histogram("dishcrafter_output_tokens", "Recipe tokens per request", TOKEN_BUCKETS)
+profiles = Counter("dishcrafter_profiled_requests_total", "Requests run under the torch profiler")
+METRICS = (requests, request_seconds, stage_seconds, queue_wait_seconds, input_tokens, output_tokens,
+           output_length, profiles)
+_lock = threading.Lock()
+
+# Off unless configured or DISHCRAFTER_TRACING is set; when off, begin() returns
+# None and every helper below is a no-op
+enabled = bool(os.environ.get("DISHCRAFTER_TRACING"))
+profile_rate = 0.0
+profile_dir = PROFILE_DIR
+
+
+def configure(enable=True, rate=0.0, directory=PROFILE_DIR):
+    global enabled, profile_rate, profile_dir
+    enabled = enable
+    profile_rate = rate
+    profile_dir = directory
+
+
+# Timings and token counts of one request (or one bulk call of `prompts` prompts).
+# Stages: clean, tokenize, transfer, encoder, decoder, decode.
+class Trace:
+    __slots__ = ("start", "prompts", "stages", "queue_wait", "input_tokens", "output_tokens", "profile")
+
+    def __init__(self, prompts=1):
+        self.start = time.perf_counter()
+        self.prompts = prompts
+        self.stages = {}
+        self.queue_wait = None
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.profile = profile_rate > 0 and random.random() < profile_rate
+
+    def add(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+
+def begin(prompts=1):
+    return Trace(prompts) if enabled else None
+
+
+class _Stage:
+    __slots__ = ("traces", "name", "start")
+
+    def __init__(self, traces, name):
+        self.traces = traces
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        for trace in self.traces:
+            trace.add(self.name, seconds)
+
+
+_NULL = nullcontext()
+
+
+# Time a block as `name` for one trace
+def stage(trace, name):
+    return _Stage((trace,), name) if trace is not None else _NULL
+
+
+# Time a block as `name` for every distinct trace in a batch
+def batch_stage(traces, name):
+    traces = _distinct(traces)
+    return _Stage(traces, name) if traces else _NULL
+
+
+def _distinct(traces):
+    if not traces:
+        return ()
+    return list({id(t): t for t in traces if t is not None}.values())
+
+
+# Run a block under the torch profiler if any trace in it was sampled, writing
+# a Chrome trace to profile_dir
+@contextmanager
+def profile(traces):
+    sampled = [t for t in _distinct(traces) if t.profile]
+    if not sampled:
+        yield
+        return
+    import torch
+
+    activities = [torch.profiler.ProfilerActivity.CPU]
+    if torch.cuda.is_available():
+        activities.append(torch.profiler.ProfilerActivity.CUDA)
+    with torch.profiler.profile(activities=activities) as profiler:
+        yield
+    os.makedirs(profile_dir, exist_ok=True)
+    profiler.export_chrome_trace(os.path.join(profile_dir, f"trace_{time.time_ns()}.json"))
+    with _lock:
+        profiles.inc(len(sampled))
+
+
+# Record a finished trace; `path` is how the request was answered
+def finish(trace, path):
+    if trace is None:
+        return
+    elapsed = time.perf_counter() - trace.start
+    with _lock:
+        requests.inc(trace.prompts, path)
+        request_seconds.observe(elapsed)
+        for name, seconds in trace.stages.items():
+            stage_seconds.observe(seconds, name)
+        if trace.queue_wait is not None:
+            queue_wait_seconds.observe(trace.queue_wait)
+        if trace.input_tokens:
+            input_tokens.inc(trace.input_tokens)
+        if trace.output_tokens:
+            output_tokens.inc(trace.output_tokens)
+            output_length.observe(trace.output_tokens / trace.prompts)
+
+
+# Prometheus text exposition of every metric, plus extra values given as
+# name -> (type, description, value)
+def render(extra=None):
+    with _lock:
+        lines = [line for metric in METRICS for line in metric.render()]
+    for name, (kind, description, value) in (extra or {}).items():
+        lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", f"{name} {value}"]
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    import recipe_model
+    from retrieval import read_prompts
+
+    parser = argparse.ArgumentParser(description="Trace generation over the bundled prompts and dump the metrics")
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--backend", default=None)
+    parser.add_argument("--decoding", default="greedy")
+    parser.add_argument("--profile-rate", type=float, default=0.0, help="fraction of requests to profile")
+    parser.add_argument("--profile-dir", default=PROFILE_DIR)
+    parser.add_argument("--output", default=None, help="write the metrics here instead of stdout")
+    args = parser.parse_args()
+
+    configure(True, args.profile_rate, args.profile_dir)
+    recipe_model.configure_cache(0)
+    model, tokenizer = recipe_model.load_model(backend=args.backend)
+    for prompt in read_prompts(limit=args.limit):
+        recipe_model.generate_recipe(prompt, model, tokenizer, decoding=args.decoding)
+
+    text = render()
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    else:
+        print(text, end="")
+
+
+if __name__ == "__main__":
+    main()
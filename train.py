@@ -0,0 +1,220 @@
+import argparse
+import csv
+import json
+import math
+import time
+
+import numpy as np
+import torch
+from transformers import (DataCollatorForSeq2Seq, T5ForConditionalGeneration, Trainer, TrainerCallback,
+                          TrainingArguments, default_data_collator)
+
+import dataset_cache
+from retrieval import DATASET_PATH
+from text_utils import clean_text
+from tokenization import load_tokenizer
+
+MAX_LENGTH = 128
+
+
+# Same rows as sklearn's train_test_split(data, test_size=0.2, random_state=42)
+# in Training.ipynb, without needing sklearn
+def split_rows(rows, test_size=0.2, random_state=42):
+    n_test = math.ceil(test_size * len(rows))
+    permutation = np.random.RandomState(random_state).permutation(len(rows))
+    test = [rows[i] for i in permutation[:n_test]]
+    train = [rows[i] for i in permutation[n_test:]]
+    return train, test
+
+
+def load_splits(path=DATASET_PATH, test_size=0.2, random_state=42):
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [(row["Prompt"], row["Generated Recipe"]) for row in csv.DictReader(f)]
+    return split_rows(rows, test_size, random_state)
+
+
+# Prompt/recipe pairs tokenized on first access, without padding. Padding is
+# left to the collator so each batch is only as long as its longest example.
+class RecipeDataset(torch.utils.data.Dataset):
+    def __init__(self, pairs, tokenizer, max_length=MAX_LENGTH):
+        self.pairs = pairs
+        self.tokenizer = tokenizer
+        self.max_length = max_length
+        self._encoded = [None] * len(pairs)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __getitem__(self, i):
+        encoded = self._encoded[i]
+        if encoded is None:
+            prompt, recipe = self.pairs[i]
+            source = self.tokenizer(clean_text(prompt), truncation=True, max_length=self.max_length)
+            target = self.tokenizer(clean_text(recipe), truncation=True, max_length=self.max_length)
+            encoded = {
+                "input_ids": source["input_ids"],
+                "attention_mask": source["attention_mask"],
+                "labels": target["input_ids"],
+            }
+            self._encoded[i] = encoded
+        return encoded
+
+
+# Rows of a pre-tokenized TokenCache (see dataset_cache.py), converted to
+# lists only when the collator asks for them
+class CachedRecipeDataset(torch.utils.data.Dataset):
+    def __init__(self, cache, indices):
+        self.cache = cache
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, i):
+        prompt, recipe = self.cache[self.indices[i]]
+        return {
+            "input_ids": prompt.tolist(),
+            "attention_mask": [1] * len(prompt),
+            "labels": recipe.tolist(),
+        }
+
+
+# Training.ipynb's setup: every example padded to the longest one in its split,
+# pad tokens left in the labels
+def padded_dataset(pairs, tokenizer, max_length=MAX_LENGTH):
+    from datasets import Dataset
+
+    prompts = [clean_text(p) for p, _ in pairs]
+    recipes = [clean_text(r) for _, r in pairs]
+    encodings = tokenizer(prompts, truncation=True, padding=True, max_length=max_length)
+    labels = tokenizer(recipes, truncation=True, padding=True, max_length=max_length)
+    return Dataset.from_dict({
+        "input_ids": encodings["input_ids"],
+        "attention_mask": encodings["attention_mask"],
+        "labels": labels["input_ids"],
+    })
+
+
+# Wraps a collator to count real and padded tokens in every training batch
+class TokenCounter:
+    def __init__(self, collator, pad_token_id):
+        self.collator = collator
+        self.pad_token_id = pad_token_id
+        self.tokens = 0
+        self.padded_tokens = 0
+
+    def __call__(self, features):
+        batch = self.collator(features)
+        for name in ("input_ids", "labels"):
+            ids = torch.as_tensor(batch[name])
+            self.padded_tokens += ids.numel()
+            self.tokens += int(((ids != self.pad_token_id) & (ids != -100)).sum())
+        return batch
+
+
+class EpochTimer(TrainerCallback):
+    def __init__(self, counter):
+        self.counter = counter
+        self.epochs = []
+
+    def on_epoch_begin(self, args, state, control, **kwargs):
+        self._start = time.perf_counter()
+        self._tokens = self.counter.tokens
+        self._padded = self.counter.padded_tokens
+
+    def on_epoch_end(self, args, state, control, **kwargs):
+        seconds = time.perf_counter() - self._start
+        tokens = self.counter.tokens - self._tokens
+        padded = self.counter.padded_tokens - self._padded
+        self.epochs.append({
+            "epoch": len(self.epochs) + 1,
+            "seconds": seconds,
+            "tokens_per_sec": tokens / seconds,
+            "padded_tokens_per_sec": padded / seconds,
+            "padding_efficiency": tokens / padded if padded else 1.0,
+        })
+        print(json.dumps(self.epochs[-1]))
+
+
+def train(args):
+    tokenizer = load_tokenizer(args.base_model)
+    model = T5ForConditionalGeneration.from_pretrained(args.base_model)
+    if args.token_cache:
+        cache = dataset_cache.open_cache(args.dataset, tokenizer, args.token_cache)
+        train_pairs, test_pairs = split_rows(list(range(len(cache))))
+    else:
+        train_pairs, test_pairs = load_splits(args.dataset)
+    if args.limit:
+        train_pairs, test_pairs = train_pairs[:args.limit], test_pairs[:args.limit // 4 or 1]
+
+    if args.token_cache:
+        train_dataset = CachedRecipeDataset(cache, train_pairs)
+        eval_dataset = CachedRecipeDataset(cache, test_pairs)
+        collator = DataCollatorForSeq2Seq(tokenizer, model=model, padding="longest", label_pad_token_id=-100)
+    elif args.baseline:
+        train_dataset = padded_dataset(train_pairs, tokenizer)
+        eval_dataset = padded_dataset(test_pairs, tokenizer)
+        collator = default_data_collator
+    else:
+        train_dataset = RecipeDataset(train_pairs, tokenizer)
+        eval_dataset = RecipeDataset(test_pairs, tokenizer)
+        # Pads each batch to its longest example; pad positions in labels become -100
+        # so they are ignored by the loss
+        collator = DataCollatorForSeq2Seq(tokenizer, model=model, padding="longest", label_pad_token_id=-100)
+    counter = TokenCounter(collator, tokenizer.pad_token_id)
+    timer = EpochTimer(counter)
+
+    training_args = TrainingArguments(
+        output_dir=args.checkpoint_dir,
+        num_train_epochs=args.epochs,
+        per_device_train_batch_size=args.batch_size,
+        per_device_eval_batch_size=args.batch_size,
+        warmup_steps=500,
+        weight_decay=0.01,
+        logging_steps=10,
+        eval_strategy="epoch",
+        save_strategy="epoch",
+        load_best_model_at_end=True,
+        # Batches drawn from length-sorted mega-batches, so examples of similar length are padded together
+        group_by_length=not args.baseline,
+        remove_unused_columns=False,
+        report_to=[],
+    )
+    trainer = Trainer(
+        model=model,
+        args=training_args,
+        train_dataset=train_dataset,
+        eval_dataset=eval_dataset,
+        data_collator=counter,
+        callbacks=[timer],
+    )
+    trainer.train()
+
+    if args.output:
+        trainer.save_model(args.output)
+        tokenizer.save_pretrained(args.output)
+    return timer.epochs
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fine-tune t5-small on the bundled recipe dataset")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--base-model", default="t5-small")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=None, help="train on the first N training rows")
+    parser.add_argument("--checkpoint-dir", default="./results")
+    parser.add_argument("--output", default="./trained_model",
+                        help="where to save the final model and tokenizer (empty to skip)")
+    parser.add_argument("--token-cache", default=None, metavar="DIR",
+                        help="read pre-tokenized ids from a dataset_cache.py cache in DIR (built if missing)")
+    parser.add_argument("--baseline", action="store_true",
+                        help="use Training.ipynb's globally padded dataset, for comparison")
+    args = parser.parse_args()
+
+    epochs = train(args)
+    print(json.dumps({"baseline": args.baseline, "epochs": epochs}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
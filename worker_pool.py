@@ -0,0 +1,120 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+import torch
+
+import recipe_model
+from text_utils import clean_text
+
+# Model and tokenizer loaded in the parent before forking. Forked workers
+# inherit them copy-on-write, so the weights are shared rather than copied.
+_shared = None
+
+
+def _init_worker(threads, model_path, backend):
+    global _shared
+    torch.set_num_threads(threads)
+    # Workers only generate: the parent answers retrieval hits before
+    # dispatching, and pool jobs don't use the result cache
+    recipe_model.configure_cache(0)
+    recipe_model.retrieval_index = None
+    if _shared is None:
+        # Spawned workers load their own copy; safetensors weights are
+        # memory-mapped, so the pages still come from the shared page cache
+        _shared = recipe_model.load_model(model_path, backend=backend, torch_device="cpu")
+
+
+# `answers` pairs each prompt with its retrieved recipe, or None to generate it
+def _generate_chunk(task):
+    answers, max_length, decoding = task
+    model, tokenizer = _shared
+    missing = [prompt for prompt, recipe in answers if recipe is None]
+    generated = iter(recipe_model.generate_recipes(missing, model, tokenizer, max_length, decoding)
+                     if missing else ())
+    return [recipe if recipe is not None else next(generated) for _, recipe in answers]
+
+
+# Recipe from the parent's retrieval index (see recipe_model.configure_retrieval), or None
+def _retrieve(prompt):
+    index = recipe_model.retrieval_index
+    return index.lookup(clean_text(prompt)) if index is not None else None
+
+
+# Process pool for CPU generation: N workers, each with its own torch
+# intra-op thread count, pull chunks of prompts from a shared task queue.
+# Results come back in input order.
+class WorkerPool:
+    def __init__(self, workers=None, threads_per_worker=None, model_path=recipe_model.MODEL_PATH,
+                 backend=None, chunk_size=8):
+        global _shared
+        self.workers = workers or os.cpu_count() or 1
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // self.workers)
+        self.chunk_size = chunk_size
+
+        methods = multiprocessing.get_all_start_methods()
+        if "fork" in methods:
+            # Load once and fork, before the parent has run any inference
+            # (torch's thread pools do not survive a fork). Always on the CPU:
+            # forked children can't use a CUDA context from the parent.
+            _shared = recipe_model.load_model(model_path, backend=backend, torch_device="cpu")
+            context = multiprocessing.get_context("fork")
+        else:
+            context = multiprocessing.get_context("spawn")
+        self.start_method = context.get_start_method()
+        self._pool = context.Pool(self.workers, initializer=_init_worker,
+                                  initargs=(self.threads_per_worker, model_path, backend))
+
+    # Yield recipes in input order as chunks finish, for streaming bulk jobs
+    def imap(self, prompts, max_length=150, decoding="greedy"):
+        def tasks():
+            chunk = []
+            for prompt in prompts:
+                chunk.append((prompt, _retrieve(prompt)))
+                if len(chunk) == self.chunk_size:
+                    yield chunk, max_length, decoding
+                    chunk = []
+            if chunk:
+                yield chunk, max_length, decoding
+
+        for recipes in self._pool.imap(_generate_chunk, tasks()):
+            yield from recipes
+
+    def generate(self, prompts, max_length=150, decoding="greedy"):
+        return list(self.imap(prompts, max_length, decoding))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def main():
+    from retrieval import read_prompts
+
+    parser = argparse.ArgumentParser(description="Generate the bundled prompts with a process pool")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--threads-per-worker", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=8)
+    parser.add_argument("--limit", type=int, default=200)
+    parser.add_argument("--backend", default=None)
+    args = parser.parse_args()
+
+    prompts = read_prompts(limit=args.limit)
+    with WorkerPool(args.workers, args.threads_per_worker, backend=args.backend,
+                    chunk_size=args.chunk_size) as pool:
+        start = time.perf_counter()
+        recipes = pool.generate(prompts)
+        elapsed = time.perf_counter() - start
+    print(f"{len(recipes)} recipes in {elapsed:.2f}s ({len(recipes) / elapsed:.1f} prompts/s) "
+          f"with {pool.workers} workers x {pool.threads_per_worker} threads ({pool.start_method})")
+
+
+if __name__ == "__main__":
+    main()